@@ -1,9 +1,23 @@
+import hashlib
+import json
+import os
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.images import get_image_dimensions
+from django.urls import reverse
+from django.utils import timezone
+from easy_thumbnails import models as easy_thumbnails_models, utils as easy_thumbnails_utils
 from easy_thumbnails.alias import aliases
 from easy_thumbnails.files import get_thumbnailer
 from filer.models import File as FilerFile, Image as FilerImage
 from filer.utils.filer_easy_thumbnails import FilerThumbnailer
+from PIL import Image
 
-from retina import SupportsRetina, ImageAdapterContract, Optional
+from retina import SupportsRetina, SupportsPlaceholder, SupportsClientHints, ImageAdapterContract, ClientHints, \
+    Optional, Dict, List, get_profile
+from retina.placeholders import lqip, dominant_color
 
 
 class FilerFileImageProxy(object):
@@ -29,27 +43,119 @@ class FilerFileImageProxy(object):
         return getattr(self.wrappee, attr)
 
 
-class FilerFileAdapter(SupportsRetina, ImageAdapterContract):
+# Directory within the thumbnail base dir where thumbnails shared by identical uploads are stored
+CONTENT_HASH_DIR = 'retina'
+
+
+def content_hash_name(sha1: str, name: str) -> str:
+    """ Returns the name under which thumbnails of every file with the given content hash are stored """
+    return os.path.join(CONTENT_HASH_DIR, sha1[:2], sha1 + os.path.splitext(name)[1].lower())
+
+
+class ContentHashThumbnailer(FilerThumbnailer):
+    """
+    Thumbnailer which names thumbnails after the content hash of the source instead of its path, so identical
+    uploads share their thumbnails as well as the easy_thumbnails source and thumbnail cache. The source itself
+    is still read from its real location.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.shared_name = kwargs.pop('shared_name')
+        super().__init__(*args, **kwargs)
+
+    def get_thumbnail_name(self, thumbnail_options, transparent=False, high_resolution=False):
+        name = self.name
+        self.name = self.shared_name
+
+        try:
+            return super().get_thumbnail_name(thumbnail_options, transparent=transparent,
+                                              high_resolution=high_resolution)
+        finally:
+            self.name = name
+
+    def thumbnail_exists(self, thumbnail_name):
+        if self.remote_source:
+            return False
+
+        # The content hash in the name already guarantees that the thumbnail was rendered from the same content,
+        # comparing modification times with the source (which might be a newer duplicate) would only cause
+        # needless renders.
+        if easy_thumbnails_utils.is_storage_local(self.thumbnail_storage):
+            return self.thumbnail_storage.exists(thumbnail_name)
+
+        return self.get_thumbnail_cache(thumbnail_name) or False
+
+    def get_source_cache(self, create=False, update=False):
+        if self.remote_source:
+            return None
+        if hasattr(self, '_source_cache') and not update:
+            if self._source_cache or not create:
+                return self._source_cache
+
+        update_modified = (update or create) and timezone.now()
+        self._source_cache = easy_thumbnails_models.Source.objects.get_file(
+            create=create, update_modified=update_modified,
+            storage=self.source_storage, name=self.shared_name,
+            check_cache_miss=self.thumbnail_check_cache_miss)
+        return self._source_cache
+
+
+class FilerFileAdapter(SupportsRetina, SupportsPlaceholder, SupportsClientHints, ImageAdapterContract):
     @staticmethod
     def _is_image(file: FilerFile) -> bool:
         return file.extension in ['jpg', 'jpeg', 'png']
 
+    @staticmethod
+    def _image_adapter() -> type:
+        """ Adapter the images among the files get delegated to """
+        return FilerImageAdapter
+
     @classmethod
     def url(cls, file: FilerFile, alias: Optional[str] = None) -> str:
         if cls._is_image(file):
             file = FilerFileImageProxy(file)
-            return FilerImageAdapter().url(file=file, alias=alias)
+            return cls._image_adapter().url(file=file, alias=alias)
 
         return file.url
 
     @classmethod
-    def retina(cls, file: FilerFile, alias: Optional[str] = None, density: Optional[int] = 1) -> list:
+    def retina(cls, file: FilerFile, alias: Optional[str] = None, density: Optional[int] = 1,
+               profiles: Optional[Dict[int, dict]] = None, hints: Optional[ClientHints] = None) -> list:
         if cls._is_image(file):
             file = FilerFileImageProxy(file)
-            return FilerImageAdapter().retina(file=file, alias=alias, density=density)
+            return cls._image_adapter().retina(file=file, alias=alias, density=density, profiles=profiles,
+                                               hints=hints)
 
         return [file.url]
 
+    @classmethod
+    def render(cls, file: FilerFile, options: dict) -> str:
+        if cls._is_image(file):
+            file = FilerFileImageProxy(file)
+            return cls._image_adapter().render(file=file, options=options)
+
+        return file.url
+
+    @classmethod
+    def placeholder(cls, file: FilerFile, alias: Optional[str] = None, density: Optional[int] = 1,
+                    profiles: Optional[Dict[int, dict]] = None, hints: Optional[ClientHints] = None) -> dict:
+        if cls._is_image(file):
+            file = FilerFileImageProxy(file)
+            return cls._image_adapter().placeholder(file=file, alias=alias, density=density, profiles=profiles,
+                                                    hints=hints)
+
+        return {}
+
+    @classmethod
+    def variants(cls, file: FilerFile, density: Optional[int] = 1, profiles: Optional[Dict[int, dict]] = None,
+                 alias_profiles: Optional[Dict[str, Dict[int, dict]]] = None) -> dict:
+        if cls._is_image(file):
+            file = FilerFileImageProxy(file)
+            return cls._image_adapter().variants(file=file, density=density, profiles=profiles,
+                                                 alias_profiles=alias_profiles)
+
+        return {}
+
     @staticmethod
     def alt(file: FilerFile) -> str:
         for attribute in ['default_alt_text', 'name', 'original_filename']:
@@ -59,43 +165,70 @@ class FilerFileAdapter(SupportsRetina, ImageAdapterContract):
         return ''
 
 
-class FilerImageAdapter(SupportsRetina, ImageAdapterContract):
-    @staticmethod
-    def url(file: FilerImage, alias: Optional[str] = None) -> str:
+class FilerImageAdapter(SupportsRetina, SupportsPlaceholder, SupportsClientHints, ImageAdapterContract):
+    @classmethod
+    def url(cls, file: FilerImage, alias: Optional[str] = None) -> str:
         if not alias:
             return file.url
 
-        return get_thumbnailer(file)[alias].url
+        return cls.thumbnailer(file)[alias].url
+
+    @staticmethod
+    def thumbnailer(file: FilerImage):
+        return get_thumbnailer(file)
+
+    @staticmethod
+    def source_name(file: FilerImage) -> str:
+        """ Name identifying the source of the thumbnails, e.g. in cache keys """
+        return file.file.name
 
     @classmethod
-    def retina(cls, file: FilerImage, alias: Optional[str] = None, density: Optional[int] = 1) -> list:
+    def retina(cls, file: FilerImage, alias: Optional[str] = None, density: Optional[int] = 1,
+               profiles: Optional[Dict[int, dict]] = None, hints: Optional[ClientHints] = None) -> list:
         if alias:
-            return cls.retina_upscale(file, alias, density)
+            return cls.retina_upscale(file, alias, density, profiles, hints)
 
-        return cls.retina_downscale(file, density)
+        return cls.retina_downscale(file, density, profiles, hints)
 
     @staticmethod
-    def retina_downscale(file: FilerImage, density: Optional[int] = 1) -> list:
-        thumbnailer = get_thumbnailer(file)
+    def apply_profiles(options: list, profiles: Optional[Dict[int, dict]] = None) -> list:
+        """
+        Applies the encoder profile of each density to the given list of thumbnail options. Since
+        easy_thumbnails puts quality and subsampling into the thumbnail name, the resulting names
+        stay deterministic for a given set of profiles.
+        """
+        return [{**item, **get_profile(profiles, i + 1)} for i, item in enumerate(options)]
 
+    @classmethod
+    def downscale_options(cls, file: FilerImage, density: Optional[int] = 1,
+                          profiles: Optional[Dict[int, dict]] = None) -> list:
+        """
+        Returns the thumbnail options of every downscaled version except the last one, which is the
+        original image itself and therefore can't be affected by any profile.
+        """
         dimensions = (file.width, file.height)
         base = tuple(round(size / density) for size in dimensions)
 
-        # Start by adding the base size as key 0 to the files list
-        files = [thumbnailer.get_thumbnail({'size': base}).url]
+        # Start by adding the base size as key 0 to the options list
+        options = [{'size': base}]
 
         # Add everything in between (e.g. density=3 results in base*2 since case 1 and 3 are covered
         for i in range(2, density):
-            options = {'size': tuple(size * i for size in base)}
-            files.append(thumbnailer.get_thumbnail(options).url)
+            options.append({'size': tuple(size * i for size in base)})
 
-        # End with the original image, since we're downscaling we know the original equals the density
-        files.append(file.url)
-        return files
+        return cls.apply_profiles(options, profiles)
+
+    @classmethod
+    def upscale_options(cls, file: FilerImage, alias: Optional[str] = None, density: Optional[int] = 1,
+                        profiles: Optional[Dict[int, dict]] = None) -> list:
+        """
+        Returns the thumbnail options of every upscaled version of the given alias.
+        """
+        return cls.apply_profiles(cls._alias_options(file, alias, density), profiles)
 
     @staticmethod
-    def retina_upscale(file: FilerImage, alias: Optional[str] = None, density: Optional[int] = 1) -> list:
-        thumbnailer = get_thumbnailer(file)
+    def _alias_options(file: FilerImage, alias: Optional[str] = None, density: Optional[int] = 1) -> list:
+        """ Returns the unprofiled thumbnail options of every upscaled version """
 
         # We need to manually raise a KeyError since the get function can return None
         options = dict(aliases.get(alias))
@@ -107,7 +240,7 @@ class FilerImageAdapter(SupportsRetina, ImageAdapterContract):
         if getattr(file, 'subject_location', None):
             options.update({'subject_location': file.subject_location})
 
-        files = [thumbnailer.get_thumbnail(options).url]
+        ret = [options]
 
         # Throws AttributeError if no size defined so make sure this property is set in your thumbnail alias
         original_size = options['size']
@@ -117,11 +250,249 @@ class FilerImageAdapter(SupportsRetina, ImageAdapterContract):
             # don't want to change the original ones
             new_options = options.copy()
             new_options.update({'size': tuple(size * (i + 1) for size in original_size)})
+            ret.append(new_options)
 
-            files.append(thumbnailer.get_thumbnail(new_options).url)
+        return ret
 
+    @classmethod
+    def retina_downscale(cls, file: FilerImage, density: Optional[int] = 1,
+                         profiles: Optional[Dict[int, dict]] = None, hints: Optional[ClientHints] = None) -> list:
+        options = cls.downscale_options(file, density, profiles)
+        densities = hints.densities(density, options[0]['size'][0]) if hints else None
+        files = cls._urls(file, options, densities)
+
+        # End with the original image, since we're downscaling we know the original equals the density
+        files.append(file.url)
         return files
 
+    @classmethod
+    def retina_upscale(cls, file: FilerImage, alias: Optional[str] = None, density: Optional[int] = 1,
+                       profiles: Optional[Dict[int, dict]] = None, hints: Optional[ClientHints] = None) -> list:
+        options = cls.upscale_options(file, alias, density, profiles)
+        densities = hints.densities(density, options[0]['size'][0]) if hints else None
+
+        return cls._urls(file, options, densities)
+
+    @classmethod
+    def _urls(cls, file: FilerImage, options: list, densities: Optional[List[int]] = None) -> list:
+        """
+        Renders the thumbnails of the given densities (all of them if None) and returns their urls. Thumbnails of
+        other densities are only returned if they already exist, otherwise they get a lazy url instead.
+        """
+        thumbnailer = cls.thumbnailer(file)
+        urls = []
+
+        for i, item in enumerate(options):
+            if densities is None or i + 1 in densities:
+                urls.append(thumbnailer.get_thumbnail(item).url)
+                continue
+
+            thumbnail = thumbnailer.get_existing_thumbnail(item)
+            urls.append(thumbnail.url if thumbnail else cls.lazy_url(file, item))
+
+        return urls
+
+    @staticmethod
+    def lazy_url(file: FilerImage, options: dict) -> str:
+        """ Returns an url which renders the thumbnail once it gets requested, see `retina.views.thumbnail` """
+        token = signing.dumps({'pk': file.pk, 'options': options}, salt='retina.thumbnail', compress=True)
+
+        return reverse('retina:thumbnail', kwargs={'token': token})
+
+    @classmethod
+    def render(cls, file: FilerImage, options: dict) -> str:
+        """ Renders a single thumbnail with the given options and returns its url """
+        return cls.thumbnailer(file).get_thumbnail(options).url
+
+    @classmethod
+    def profile_report(cls, file: FilerImage, alias: Optional[str] = None, density: Optional[int] = 1,
+                       profiles: Optional[Dict[int, dict]] = None) -> list:
+        """
+        Compares the size of every profiled version with the one easy_thumbnails would render without any
+        profile. Versions which don't exist yet are only rendered in memory, nothing gets saved:
+            [
+                {'density': 2, 'profile': {'quality': 70}, 'before': 80000, 'after': 50000},
+                ...
+            ]
+        """
+        if alias:
+            options = cls._alias_options(file, alias, density)
+        else:
+            options = cls.downscale_options(file, density)
+
+        thumbnailer = cls.thumbnailer(file)
+        report = []
+
+        for i, item in enumerate(options):
+            profile = get_profile(profiles, i + 1)
+            if not profile:
+                continue
+
+            report.append({
+                'density': i + 1,
+                'profile': profile,
+                'before': thumbnailer.get_thumbnail(item, save=False).size,
+                'after': thumbnailer.get_thumbnail({**item, **profile}, save=False).size,
+            })
+
+        return report
+
+    @classmethod
+    def variants(cls, file: FilerImage, density: Optional[int] = 1, profiles: Optional[Dict[int, dict]] = None,
+                 alias_profiles: Optional[Dict[str, Dict[int, dict]]] = None) -> dict:
+        """
+        Returns the names of every thumbnail retina may render for the given file with the current global
+        aliases, mapped to a tuple of the alias (None when downscaling) and the density they belong to.
+        Placeholder files are included with a density of 0. Nothing gets rendered or read from the storage.
+        Curves in `alias_profiles` replace `profiles` for their alias, see `Manager.get_profiles`.
+        """
+        thumbnailer = cls.thumbnailer(file)
+        option_sets = []
+        variants = {}
+
+        if getattr(file, 'width', None) and getattr(file, 'height', None):
+            option_sets.append((None, cls.downscale_options(file, density, profiles)))
+
+        for alias, options in aliases.all().items():
+            if 'size' in options:
+                alias_curve = (alias_profiles or {}).get(alias) or profiles
+                option_sets.append((alias, cls.upscale_options(file, alias, density, alias_curve)))
+
+        for alias, options in option_sets:
+            for i, item in enumerate(options):
+                # easy_thumbnails picks another extension for transparent images, both are legit
+                for transparent in (False, True):
+                    variants[cls.thumbnail_name(thumbnailer, item, transparent)] = (alias, i + 1)
+
+            variants['{}.retina{}.json'.format(cls.thumbnail_name(thumbnailer, options[0]), density)] = (alias, 0)
+
+        return variants
+
+    @staticmethod
+    def thumbnail_name(thumbnailer, options: dict, transparent: bool = False) -> str:
+        """
+        Filers thumbnailer doesn't apply the default options when building thumbnail names, so we need
+        to do it ourselves to end up with the same name as easy_thumbnails.
+        """
+        return thumbnailer.get_thumbnail_name(thumbnailer.get_options(options), transparent=transparent)
+
+    @staticmethod
+    def _source_version(file: FilerImage) -> str:
+        """ Changes whenever the content of the source file changes """
+        return getattr(file, 'sha1', '') or str(getattr(file, 'modified_at', ''))
+
+    @staticmethod
+    def thumbnail_dimensions(source_size: tuple, options: dict) -> list:
+        """
+        Returns the dimensions of the thumbnail easy_thumbnails renders from a source of the given size,
+        following the math of its `scale_and_crop` processor without touching any image.
+        """
+        source_x, source_y = [float(size) for size in source_size]
+        target_x, target_y = [int(size) for size in options['size']]
+        crop, zoom = options.get('crop'), options.get('zoom')
+
+        if crop or not target_x or not target_y:
+            scale = max(target_x / source_x, target_y / source_y)
+        else:
+            scale = min(target_x / source_x, target_y / source_y)
+
+        if not target_x:
+            target_x = round(source_x * scale)
+        elif not target_y:
+            target_y = round(source_y * scale)
+
+        if zoom:
+            if not crop:
+                target_x, target_y = round(source_x * scale), round(source_y * scale)
+                crop = True
+            scale *= (100 + int(zoom)) / 100.0
+
+        if scale < 1.0 or (scale > 1.0 and options.get('upscale')):
+            source_x, source_y = int(round(source_x * scale)), int(round(source_y * scale))
+
+        if crop and crop != 'scale':
+            return [int(min(source_x, target_x)), int(min(source_y, target_y))]
+
+        return [int(source_x), int(source_y)]
+
+    @staticmethod
+    def _source_size(file: FilerImage) -> tuple:
+        # Files delegated by the FilerFileAdapter don't know their dimensions
+        if getattr(file, 'width', None) and getattr(file, 'height', None):
+            return file.width, file.height
+
+        return get_image_dimensions(file.file)
+
+    @classmethod
+    def placeholder(cls, file: FilerImage, alias: Optional[str] = None, density: Optional[int] = 1,
+                    profiles: Optional[Dict[int, dict]] = None, hints: Optional[ClientHints] = None) -> dict:
+        """
+        Placeholders are computed once per source version and persisted as a json file next to the base
+        thumbnail in the thumbnail storage. On top of that they're kept in the django cache, so a
+        regular render doesn't even touch the storage. Only a single density gets decoded, the
+        dimensions of the others are derived from their options. With client hints that's the density
+        `retina` renders for the client, otherwise the base thumbnail.
+        """
+        thumbnailer = cls.thumbnailer(file)
+        if alias:
+            options = cls.upscale_options(file, alias, density, profiles)
+        else:
+            options = cls.downscale_options(file, density, profiles)
+
+        # The thumbnail name covers every option of the alias, so changing any of them never returns a stale result
+        name = '{}.retina{}.json'.format(cls.thumbnail_name(thumbnailer, options[0]), density)
+        version = cls._source_version(file)
+        key = 'retina:placeholder:' + hashlib.md5('{}:{}'.format(name, version).encode('utf-8')).hexdigest()
+
+        data = cache.get(key)
+        if data is not None:
+            return data
+
+        storage = thumbnailer.thumbnail_storage
+
+        if storage.exists(name):
+            with storage.open(name) as fh:
+                stored = json.loads(fh.read().decode('utf-8'))
+
+            if stored.get('version') == version:
+                data = stored['placeholder']
+
+        if data is None:
+            index = hints.densities(density, options[0]['size'][0])[0] - 1 if hints else 0
+
+            # When downscaling the highest density is the original itself
+            if index < len(options):
+                decode_storage, decode_name = storage, thumbnailer.get_thumbnail(options[index]).name
+            else:
+                decode_storage, decode_name = thumbnailer.source_storage, thumbnailer.name
+
+            # Decode the image once, reading its dimensions through the thumbnail file would close it
+            with decode_storage.open(decode_name) as fh:
+                image = Image.open(fh)
+                image.load()
+
+            source_size = cls._source_size(file)
+            dimensions = [cls.thumbnail_dimensions(source_size, item) for item in options]
+
+            if not alias:
+                dimensions.append(list(source_size))
+
+            dimensions[index] = list(image.size)
+
+            data = {
+                'lqip': lqip(image),
+                'color': dominant_color(image),
+                'dimensions': dimensions,
+            }
+
+            if storage.exists(name):
+                storage.delete(name)
+
+            storage.save(name, ContentFile(json.dumps({'version': version, 'placeholder': data}).encode('utf-8')))
+
+        cache.set(key, data, None)
+        return data
+
     @staticmethod
     def alt(file: FilerImage) -> str:
         for attribute in ['default_alt_text', 'name', 'original_filename']:
@@ -129,3 +500,40 @@ class FilerImageAdapter(SupportsRetina, ImageAdapterContract):
                 return getattr(file, attribute)
 
         return ''
+
+
+class ContentHashFilerImageAdapter(FilerImageAdapter):
+    """
+    Opt-in adapter which shares thumbnails between filer images with the same content, based on the `sha1`
+    filer stores for every file. Images without a hash fall back to the regular path based thumbnails, and so
+    do private ones, since filer only serves thumbnails of private files from below their own path.
+    """
+
+    @staticmethod
+    def _shares_thumbnails(file: FilerImage) -> bool:
+        return bool(getattr(file, 'sha1', None) and getattr(file, 'is_public', True))
+
+    @classmethod
+    def thumbnailer(cls, file: FilerImage):
+        if not cls._shares_thumbnails(file):
+            return get_thumbnailer(file)
+
+        return ContentHashThumbnailer(
+            file=file.file, name=file.file.name,
+            shared_name=content_hash_name(file.sha1, file.file.name),
+            source_storage=file.file.source_storage,
+            thumbnail_storage=file.file.thumbnail_storage,
+            thumbnail_basedir=file.file.thumbnail_basedir)
+
+    @classmethod
+    def source_name(cls, file: FilerImage) -> str:
+        if not cls._shares_thumbnails(file):
+            return file.file.name
+
+        return content_hash_name(file.sha1, file.file.name)
+
+
+class ContentHashFilerFileAdapter(FilerFileAdapter):
+    @staticmethod
+    def _image_adapter() -> type:
+        return ContentHashFilerImageAdapter
@@ -1,6 +1,8 @@
 from collections import defaultdict
 from typing import Optional, Dict, List
 
+from .hints import ClientHints, get_current, mark_used
+
 
 class ImageAdapterContract(object):
     """
@@ -24,14 +26,32 @@ class ImageAdapterContract(object):
 
 class ManagerContract(object):
     density = 0
+    profiles: Dict[int, dict] = {}
+    alias_profiles: Dict[str, Dict[int, dict]] = {}
+    client_hints = False
 
     def get_adapter(self, file) -> ImageAdapterContract:
         raise NotImplementedError
 
+    def get_profiles(self, alias: Optional[str] = None,
+                     profiles: Optional[Dict[int, dict]] = None) -> Optional[Dict[int, dict]]:
+        """
+        Returns the encoder profiles to render the given alias with. A curve defined for the alias replaces
+        the passed in one (the one of the manager by default) as a whole.
+        """
+        if profiles is None:
+            profiles = self.profiles
+
+        if alias and self.alias_profiles.get(alias):
+            return self.alias_profiles[alias]
+
+        return profiles
+
 
 class SupportsRetina(object):
     @staticmethod
-    def retina(file, alias: Optional[str] = None, density: Optional[int] = 0) -> list:
+    def retina(file, alias: Optional[str] = None, density: Optional[int] = 0,
+               profiles: Optional[Dict[int, dict]] = None) -> list:
         """
         Must return a list of urls where each list entry has larger image dimensions then the one before. Considering
         an image with size 10x10px, the returned list has to look like this (with a density of 3):
@@ -52,10 +72,62 @@ class SupportsRetina(object):
                 90x90.jpg, -> original
             ]
 
+        The optional `profiles` parameter maps densities to encoder options (see `get_profile`) which should
+        be applied when rendering the corresponding retina version.
+        """
+        raise NotImplementedError
+
+
+class SupportsPlaceholder(object):
+    @staticmethod
+    def placeholder(file, alias: Optional[str] = None, density: Optional[int] = 0,
+                    profiles: Optional[Dict[int, dict]] = None) -> dict:
+        """
+        Must return a dict describing the srcset generated by `SupportsRetina.retina` with the same arguments,
+        so the frontend can reserve the space and show something while the real images are loading:
+            {
+                'lqip': 'data:image/jpeg;base64,...',  -> tiny inline version of the base size
+                'color': '#aabbcc',                     -> dominant color of the image
+                'dimensions': [[10, 10], [20, 20]],     -> width and height of each retina version
+            }
+
+        Since this gets called on every render, implementations should compute it once per version of
+        the source file and serve it from a cache afterwards.
         """
         raise NotImplementedError
 
 
+class SupportsClientHints(object):
+    """
+    Marks adapters whose `retina` method accepts a `hints` parameter with the `ClientHints` of the current request.
+    The returned list must still hold an url for every density, but only the densities returned by
+    `ClientHints.densities` need to be rendered right away. The others can be urls which render the image
+    once someone actually requests it. If the adapter supports placeholders as well, its `placeholder` method
+    gets the hints too, so it doesn't have to render any density the client doesn't need on its own.
+    """
+    pass
+
+
+def get_profile(profiles: Optional[Dict[int, dict]], density: int) -> dict:
+    """
+    Returns the encoder profile for the given density. A profile applies to its own density and every higher
+    one until the next profile takes over, so a quality curve like this one:
+        {
+            2: {'quality': 70},
+            3: {'quality': 50, 'subsampling': 2},
+        }
+    leaves @1 images untouched, renders @2 images with a quality of 70 and everything from @3 upwards with 50.
+    """
+    if not profiles:
+        return {}
+
+    matches = [key for key in profiles if key <= density]
+    if not matches:
+        return {}
+
+    return dict(profiles[max(matches)])
+
+
 class Manager(ManagerContract):
     """
     Helper class to always return the same dict for images. We need to cover a lot of cases,
@@ -67,6 +139,9 @@ class Manager(ManagerContract):
     box Filer Image and File objects as well as static images (represented by a string) are allowed.
     """
     density = 2  # Density of two means we'll also return a @2 version of the image, 1 will just return 1
+    profiles: Dict[int, dict] = {}  # Encoder options per density, see get_profile
+    alias_profiles: Dict[str, Dict[int, dict]] = {}  # Encoder options per density of single aliases
+    client_hints = False  # Only render the densities the client needs, see SupportsClientHints
     _adapters: Dict[type, ImageAdapterContract] = {}
 
     def update_adapters(self, adapters: dict) -> None:
@@ -74,19 +149,38 @@ class Manager(ManagerContract):
         tmp_adapters.update(adapters)
         self._adapters = tmp_adapters
 
-    def load_default_adapters(self):
+    def load_default_adapters(self, content_hash: bool = False):
+        """
+        Registers the filer adapters. With `content_hash` enabled, identical uploads share their thumbnails
+        based on the sha1 filer stores for every file.
+        """
         from filer.models import Image as FilerImage
         from filer.models import File as FilerFile
-        from retina.adapters.filer import FilerImageAdapter, FilerFileAdapter
-
-        self.update_adapters({
-            FilerImage: FilerImageAdapter,
-            FilerFile: FilerFileAdapter,
-        })
+        from retina.adapters import filer
+
+        if content_hash:
+            self.update_adapters({
+                FilerImage: filer.ContentHashFilerImageAdapter,
+                FilerFile: filer.ContentHashFilerFileAdapter,
+            })
+        else:
+            self.update_adapters({
+                FilerImage: filer.FilerImageAdapter,
+                FilerFile: filer.FilerFileAdapter,
+            })
 
     def update_density(self, density: int) -> None:
         self.density = density
 
+    def update_profiles(self, profiles: Dict[int, dict]) -> None:
+        self.profiles = profiles
+
+    def update_alias_profiles(self, alias_profiles: Dict[str, Dict[int, dict]]) -> None:
+        self.alias_profiles = alias_profiles
+
+    def update_client_hints(self, enabled: bool) -> None:
+        self.client_hints = enabled
+
     def get_adapter(self, file) -> ImageAdapterContract:
         file_type = type(file)
 
@@ -105,8 +199,12 @@ class File(object):
         self._file = file
         self._adapter = manager.get_adapter(file)
         self._density = manager.density
+        self._profiles = manager.profiles
+        self._client_hints = manager.client_hints
+        self._hints = None
         self._manager = manager
         self._additional = {}  # Allows us to pass additional data in the returned dict
+        self._placeholder = False
 
     def density(self, density: int) -> 'File':
         """ Allows us to overwrite the density for this particular File instance """
@@ -114,12 +212,34 @@ class File(object):
 
         return self
 
+    def profiles(self, profiles: Dict[int, dict]) -> 'File':
+        """ Allows us to overwrite the encoder profiles for this particular File instance """
+        self._profiles = profiles
+
+        return self
+
+    def client_hints(self, enabled: bool = True, hints: Optional[ClientHints] = None) -> 'File':
+        """
+        Allows us to only render the densities the client needs. Uses the hints of the current request
+        (see `retina.middleware.ClientHintsMiddleware`) unless they're passed in explicitly.
+        """
+        self._client_hints = enabled
+        self._hints = hints
+
+        return self
+
     def additional(self, **kwargs) -> 'File':
         """ Allows us to pass additional data in the returned dict """
         self._additional = {**self._additional, **kwargs}
 
         return self
 
+    def placeholder(self, enabled: bool = True) -> 'File':
+        """ Allows us to include placeholders and dimensions of each size in the srcset dict """
+        self._placeholder = enabled
+
+        return self
+
     def thumbnail(self, alias: Optional[str] = None) -> dict:
         """
         Basic thumbnail generation method, also used for backwards compatibility. Uses
@@ -141,9 +261,22 @@ class File(object):
         """
         alt = self._adapter.alt(self._file)
         urls = defaultdict(list)
+        placeholders = {}
         default_size = False
         real_alias = None
 
+        hint_options = {}
+
+        if self._client_hints and issubclass(self._adapter, SupportsClientHints):
+            hints = self._hints
+            if hints is None:
+                # Even without any hints sent, the response now depends on them
+                hints = get_current()
+                mark_used()
+
+            if hints:
+                hint_options['hints'] = hints
+
         if not issubclass(self._adapter, SupportsRetina):
             return self.thumbnail(alias)
 
@@ -163,10 +296,24 @@ class File(object):
             if not default_size:
                 real_alias = alias + '_' + size
 
-            urls[size] = self._adapter.retina(self._file, alias=real_alias, density=self._density)
+            # Only pass profiles along if there are any, so adapters without profile support keep working
+            profiles = self._manager.get_profiles(real_alias, self._profiles)
+            options = {'profiles': profiles} if profiles else {}
 
-        return {
+            urls[size] = self._adapter.retina(self._file, alias=real_alias, density=self._density, **options,
+                                              **hint_options)
+
+            if self._placeholder and issubclass(self._adapter, SupportsPlaceholder):
+                placeholders[size] = self._adapter.placeholder(self._file, alias=real_alias, density=self._density,
+                                                               **options, **hint_options)
+
+        ret = {
             'urls': urls,
             'alt': alt,
             **self._additional,
         }
+
+        if placeholders:
+            ret['placeholders'] = placeholders
+
+        return ret
@@ -0,0 +1,94 @@
+import math
+import threading
+from typing import Optional, List
+
+_local = threading.local()
+
+# Request headers we read, in order of precedence. The legacy names are still sent by older browsers.
+HEADERS = {
+    'dpr': ('Sec-CH-DPR', 'DPR'),
+    'width': ('Sec-CH-Width', 'Width'),
+    'viewport_width': ('Sec-CH-Viewport-Width', 'Viewport-Width'),
+}
+
+
+class ClientHints(object):
+    """
+    Holds the client hints of a request. `dpr` is the device pixel ratio, `width` the width the image is
+    rendered with in physical pixels and `viewport_width` the width of the viewport in css pixels.
+    """
+
+    def __init__(self, dpr: Optional[float] = None, width: Optional[int] = None,
+                 viewport_width: Optional[int] = None):
+        self.dpr = dpr
+        self.width = width
+        self.viewport_width = viewport_width
+
+    def __eq__(self, other):
+        return isinstance(other, ClientHints) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return 'ClientHints(dpr={}, width={}, viewport_width={})'.format(self.dpr, self.width, self.viewport_width)
+
+    def __bool__(self):
+        return any(value is not None for value in vars(self).values())
+
+    @classmethod
+    def from_meta(cls, meta: dict) -> 'ClientHints':
+        """ Reads the hints from a WSGI environ like `request.META`, ignoring malformed values """
+        values = {}
+
+        for attribute, headers in HEADERS.items():
+            for header in headers:
+                value = meta.get('HTTP_' + header.upper().replace('-', '_'))
+                try:
+                    values[attribute] = float(value) if attribute == 'dpr' else int(value)
+                except (TypeError, ValueError):
+                    continue
+
+                if values[attribute] <= 0:
+                    del values[attribute]
+                    continue
+
+                break
+
+        return cls(**values)
+
+    def densities(self, density: int, base_width: Optional[int] = None) -> List[int]:
+        """
+        Returns the densities out of 1 to `density` the client can make use of. `base_width` is the width of the
+        @1 version, without it only the device pixel ratio is taken into account. For a client with a dpr of 2
+        which renders a 300px wide @1 image in a 100px wide viewport, a single @1 version is all it needs:
+            ClientHints(dpr=2, viewport_width=100).densities(3, base_width=300) == [1]
+        """
+        target = self.dpr or 1
+
+        if base_width:
+            if self.width:
+                target = self.width / base_width
+            elif self.viewport_width:
+                target = min(target, self.viewport_width * (self.dpr or 1) / base_width)
+
+        # Tolerate rounding errors, e.g. a dpr of 2.0000001 still gets the @2 version
+        needed = math.ceil(round(target, 2))
+
+        return [min(max(needed, 1), density)]
+
+
+def get_current() -> Optional[ClientHints]:
+    """ Returns the client hints of the request being handled by the current thread """
+    return getattr(_local, 'hints', None)
+
+
+def set_current(hints: Optional[ClientHints]) -> None:
+    _local.hints = hints
+    _local.used = False
+
+
+def mark_used() -> None:
+    """ Records that the response of the current request depends on its client hints """
+    _local.used = True
+
+
+def was_used() -> bool:
+    return getattr(_local, 'used', False)
@@ -0,0 +1,183 @@
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional, List, Union, Dict
+
+from django.core.files.storage import FileSystemStorage
+from easy_thumbnails.signals import thumbnail_created
+
+from retina import File, ManagerContract, manager as default_manager
+
+_local = threading.local()
+
+
+def _record(kind: str, name: str) -> None:
+    """ Counts an event for the worker running in the current thread, if there is one """
+    counters = getattr(_local, 'counters', None)
+    if counters is not None:
+        counters[kind][name] += 1
+
+
+def _thumbnail_created(sender, **kwargs):
+    _record('renders', sender.name)
+
+
+thumbnail_created.connect(_thumbnail_created, dispatch_uid='retina.loadtest')
+
+
+class LatencyStorage(FileSystemStorage):
+    """
+    File system storage which behaves like a remote object storage by sleeping before each operation and
+    failing every now and then. Meant to be configured as filer thumbnail storage for load tests:
+        FILER_STORAGES = {
+            'public': {
+                'thumbnails': {
+                    'ENGINE': 'retina.loadtest.LatencyStorage',
+                    'OPTIONS': {'latency': {'exists': 0.03, 'save': 0.08}, 'jitter': 0.5, 'error_rate': 0.01},
+                    ...
+                },
+            },
+        }
+
+    `latency` (seconds) and `error_rate` (0 to 1) can either be a number applying to every operation or a
+    dict per operation. `jitter` is the fraction by which the latency randomly varies in both directions.
+    """
+    def __init__(self, *args, latency: Union[float, Dict[str, float]] = 0.0, jitter: float = 0.0,
+                 error_rate: Union[float, Dict[str, float]] = 0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    @staticmethod
+    def _value(setting: Union[float, Dict[str, float]], operation: str) -> float:
+        if isinstance(setting, dict):
+            return setting.get(operation, 0.0)
+
+        return setting
+
+    def _simulate(self, operation: str) -> None:
+        _record('storage', operation)
+
+        latency = self._value(self.latency, operation)
+        if latency:
+            time.sleep(max(0.0, latency * (1 + random.uniform(-self.jitter, self.jitter))))
+
+        if random.random() < self._value(self.error_rate, operation):
+            _record('storage_errors', operation)
+            raise IOError('Simulated {} failure'.format(operation))
+
+    def _open(self, name, mode='rb'):
+        self._simulate('open')
+        return super()._open(name, mode)
+
+    def _save(self, name, content):
+        self._simulate('save')
+        return super()._save(name, content)
+
+    def delete(self, name):
+        self._simulate('delete')
+        return super().delete(name)
+
+    def exists(self, name):
+        self._simulate('exists')
+        return super().exists(name)
+
+    def listdir(self, path):
+        self._simulate('listdir')
+        return super().listdir(path)
+
+    def size(self, name):
+        self._simulate('size')
+        return super().size(name)
+
+    def url(self, name):
+        self._simulate('url')
+        return super().url(name)
+
+    def get_modified_time(self, name):
+        self._simulate('modified_time')
+        return super().get_modified_time(name)
+
+
+def _work(files: list, alias: Optional[str], sizes: Optional[List[str]], manager: ManagerContract) -> dict:
+    """ Renders the srcset of every given file and returns what happened in the meantime """
+    _local.counters = {'renders': Counter(), 'storage': Counter(), 'storage_errors': Counter()}
+    latencies = []
+    errors = 0
+
+    try:
+        for file in files:
+            start = time.perf_counter()
+            try:
+                File(file, manager=manager).srcset(alias, sizes)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+        return {'latencies': latencies, 'errors': errors, **_local.counters}
+    finally:
+        _local.counters = None
+
+
+def _percentile(values: list, percentile: float) -> float:
+    if not values:
+        return 0.0
+
+    return values[min(len(values) - 1, int(round(percentile * (len(values) - 1))))]
+
+
+def run(files: list, alias: Optional[str] = None, sizes: Optional[List[str]] = None, workers: int = 8,
+        iterations: int = 1, processes: bool = False, manager: ManagerContract = default_manager) -> dict:
+    """
+    Calls `File.srcset` for every file `iterations` times, spread over `workers` threads (or processes). Every
+    worker gets every file, so concurrent requests for the same image are the norm, just like on a busy site:
+        {
+            'requests': 800,
+            'errors': 2,
+            'duration': 4.2,                    -> seconds
+            'throughput': 190.5,                -> requests per second
+            'latency': {'p50': ..., 'p90': ..., 'p99': ..., 'max': ...},
+            'renders': 24,                      -> thumbnails saved
+            'duplicate_renders': 8,             -> thumbnails saved more than once
+            'storage': {'exists': 1600, ...},   -> operations on LatencyStorage instances
+            'storage_errors': {'exists': 3, ...},
+        }
+
+    When using processes, the files and the manager must be picklable and database connections should be
+    closed beforehand, since they can't be shared with the forked workers.
+    """
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    batch = list(files) * iterations
+
+    start = time.perf_counter()
+    with executor_class(max_workers=workers) as executor:
+        futures = [executor.submit(_work, batch, alias, sizes, manager) for _ in range(workers)]
+        results = [future.result() for future in futures]
+    duration = time.perf_counter() - start
+
+    latencies = sorted(latency for result in results for latency in result['latencies'])
+    renders, storage, storage_errors = Counter(), Counter(), Counter()
+    for result in results:
+        renders.update(result['renders'])
+        storage.update(result['storage'])
+        storage_errors.update(result['storage_errors'])
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(result['errors'] for result in results),
+        'duration': duration,
+        'throughput': len(latencies) / duration if duration else 0.0,
+        'latency': {
+            'p50': _percentile(latencies, 0.5),
+            'p90': _percentile(latencies, 0.9),
+            'p99': _percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else 0.0,
+        },
+        'renders': sum(renders.values()),
+        'duplicate_renders': sum(renders.values()) - len(renders),
+        'storage': dict(storage),
+        'storage_errors': dict(storage_errors),
+    }
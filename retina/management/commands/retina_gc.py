@@ -0,0 +1,228 @@
+import os
+import re
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from easy_thumbnails import models as easy_thumbnails_models, utils as easy_thumbnails_utils
+from filer import settings as filer_settings
+from filer.models import File as FilerFile, Image as FilerImage
+from filer.models.abstract import BaseImage
+from filer.utils.filer_easy_thumbnails import thumbnail_to_original_filename
+
+from retina import manager
+from retina.adapters.filer import FilerImageAdapter, FilerFileAdapter, CONTENT_HASH_DIR
+
+
+def walk(storage, path: str):
+    """
+    Yields every directory below the given path together with its files. Only one directory listing
+    is kept in memory at a time, which is as little as the storage api allows.
+    """
+    directories, files = storage.listdir(path)
+    yield path, files
+
+    for directory in directories:
+        yield from walk(storage, os.path.join(path, directory))
+
+
+# Highest density considered when working out the alias and density of orphaned thumbnails
+MAX_DENSITY = 4
+
+# Thumbnail names as easy_thumbnails builds them for filer (`<size>_q<quality>_<options>`), including placeholders.
+# High resolution versions have an additional infix and don't match.
+THUMBNAIL_NAME = re.compile(r'__\d+x\d+_q\d+(_[^@/]*)?\.\w+(\.retina\d+\.json)?$')
+
+# Encoder profiles only end up in these parts of the thumbnail names, see `FilerImageAdapter.apply_profiles`
+PROFILE_OPTIONS = re.compile(r'_(q\d+|subsampling-\d+)(?=[_.@])')
+
+
+def strip_profile(name: str) -> str:
+    """ Removes quality and subsampling from the options part of a thumbnail name """
+    source, delimiter, options = name.rpartition('__')
+
+    return source + delimiter + PROFILE_OPTIONS.sub('', options)
+
+
+class Command(BaseCommand):
+    help = 'Reports and optionally deletes thumbnails which are unreachable with the current aliases and densities'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--density', type=int, action='append', dest='densities',
+                            help='Density to keep thumbnails for, can be passed multiple times. '
+                                 'Defaults to the density of the manager')
+        parser.add_argument('--delete', action='store_true', default=False,
+                            help='Delete orphaned thumbnails instead of just reporting them')
+        parser.add_argument('--prune-profiles', action='store_true', default=False,
+                            help='Delete reachable thumbnails rendered with other encoder profiles as well')
+
+    def handle(self, *args, **options):
+        # Single files might use higher densities than the manager, so we only delete what we're explicitly told
+        if options['delete'] and not options['densities']:
+            raise CommandError('Pass every density in use with --density to delete thumbnails')
+
+        densities = options['densities'] or [manager.density]
+        deletable = {'orphaned', 'profiled'} if options['prune_profiles'] else {'orphaned'}
+        totals = defaultdict(lambda: [0, 0])
+
+        storages = [
+            (filer_settings.FILER_PUBLICMEDIA_THUMBNAIL_STORAGE,
+             filer_settings.FILER_PUBLICMEDIA_THUMBNAIL_OPTIONS.get('base_dir', '')),
+            (filer_settings.FILER_PRIVATEMEDIA_THUMBNAIL_STORAGE,
+             filer_settings.FILER_PRIVATEMEDIA_THUMBNAIL_OPTIONS.get('base_dir', '')),
+        ]
+
+        for storage, base_dir in storages:
+            if base_dir and not storage.exists(base_dir):
+                continue
+
+            for path, files in walk(storage, base_dir):
+                groups = defaultdict(list)
+                for filename in files:
+                    source_filename = thumbnail_to_original_filename(filename)
+
+                    # Not a thumbnail at all, so it's none of our business
+                    if source_filename:
+                        groups[source_filename].append(filename)
+
+                for source_filename, filenames in groups.items():
+                    source_name = os.path.relpath(os.path.join(path, source_filename), base_dir or '.')
+                    variants = self.variants(source_name, densities)
+                    unprofiled = self.unprofiled(variants)
+
+                    # Filer only deletes the thumbnails below the path of a file, so shared ones are ours to collect
+                    # once the last upload with their content is gone
+                    known = bool(variants) or source_name.startswith(CONTENT_HASH_DIR + os.sep)
+
+                    for filename in filenames:
+                        name = os.path.join(path, filename)
+                        key = self.classify(name, variants, unprofiled, known)
+                        totals[key][0] += 1
+                        totals[key][1] += storage.size(name)
+
+                        if key[0] not in deletable:
+                            continue
+
+                        if options['delete']:
+                            self.delete(storage, name)
+
+                        if options['verbosity'] > 1:
+                            self.stdout.write('{} {}'.format('Deleted' if options['delete'] else key[0].capitalize(),
+                                                             name))
+
+        for key, (count, size) in sorted(totals.items(), key=lambda item: str(item[0])):
+            self.stdout.write('{}: {} files, {} bytes'.format(self.label(key), count, size))
+
+        count = sum(total[0] for key, total in totals.items() if key[0] in deletable)
+        size = sum(total[1] for key, total in totals.items() if key[0] in deletable)
+        self.stdout.write('{} {} thumbnails, {} bytes'.format(
+            'Deleted' if options['delete'] else 'Found', count, size))
+
+    @staticmethod
+    def delete(storage, name: str) -> None:
+        """
+        Deletes the thumbnail together with its easy_thumbnails cache entries. Remote storages rely on those to
+        tell whether a thumbnail exists, so leaving them behind would keep handing out urls of deleted files.
+        """
+        storage.delete(name)
+        easy_thumbnails_models.Thumbnail.objects.filter(
+            storage_hash=easy_thumbnails_utils.get_storage_hash(storage), name=name).delete()
+
+    @staticmethod
+    def label(key: tuple) -> str:
+        kind, alias, density = key
+
+        if kind in ('filer', 'foreign') or (kind == 'orphaned' and density is None):
+            return kind
+
+        if density == 0:
+            label = '{} placeholders'.format(alias or 'downscaled')
+        else:
+            label = '{} @{}'.format(alias or 'downscaled', density)
+
+        return label if kind == 'reachable' else '{} {}'.format(kind, label)
+
+    def variants(self, source_name: str, densities: list) -> dict:
+        """
+        Returns every thumbnail name retina may have rendered for the given source with the current aliases up to
+        `MAX_DENSITY`, mapped to a tuple of `reachable` or `orphaned`, the alias and the density (see
+        `FilerImageAdapter.variants`). Thumbnails filer renders for its admin are mapped to `filer`. Thumbnails
+        shared by identical uploads are reachable as long as any of those uploads reaches them.
+        """
+        if source_name.startswith(CONTENT_HASH_DIR + os.sep):
+            sha1 = os.path.splitext(os.path.basename(source_name))[0]
+            files = FilerFile.objects.filter(sha1=sha1)
+        else:
+            files = FilerFile.objects.filter(file=source_name)
+
+        variants = {}
+        reachable = {}
+
+        for file in files:
+            try:
+                adapter = manager.get_adapter(file)
+            except ValueError:
+                adapter = FilerImageAdapter if isinstance(file, FilerImage) else FilerFileAdapter
+
+            if not hasattr(adapter, 'variants'):
+                continue
+
+            for density in range(1, MAX_DENSITY + 1):
+                for name, (alias, step) in adapter.variants(file, density).items():
+                    variants[name] = ('orphaned', alias, step)
+
+            for density in densities:
+                for name, (alias, step) in adapter.variants(file, density, manager.profiles,
+                                                            manager.alias_profiles).items():
+                    reachable[name] = ('reachable', alias, step)
+
+            # Filer renders a couple of thumbnails for its admin on its own, those are not ours to collect
+            if isinstance(file, FilerImage):
+                thumbnailer = file.easy_thumbnails_thumbnailer
+                filer_options = list(BaseImage.DEFAULT_THUMBNAILS.values()) + [
+                    {'size': (int(size), int(size)), 'crop': True, 'upscale': True,
+                     'subject_location': file.subject_location}
+                    for size in filer_settings.FILER_ADMIN_ICON_SIZES
+                ]
+
+                for options in filer_options:
+                    for transparent in (False, True):
+                        name = FilerImageAdapter.thumbnail_name(thumbnailer, options, transparent)
+                        reachable[name] = ('filer', None, None)
+
+        variants.update(reachable)
+        return variants
+
+    @staticmethod
+    def unprofiled(variants: dict) -> dict:
+        """ Maps the names of the given variants without their encoder profile to the variants """
+        unprofiled = {}
+
+        for name, key in variants.items():
+            if key[0] == 'filer':
+                continue
+
+            # Reachable variants win, other profiles of them might still be used by single files
+            if key[0] == 'reachable' or strip_profile(name) not in unprofiled:
+                unprofiled[strip_profile(name)] = key
+
+        return unprofiled
+
+    @staticmethod
+    def classify(name: str, variants: dict, unprofiled: dict, known: bool = True) -> tuple:
+        """
+        Returns a tuple of the kind, alias and density of the given thumbnail. Reachable thumbnails rendered with
+        another profile are `profiled`. Every other thumbnail of a `known` source is `orphaned`, with the alias and
+        density if they can still be worked out. Thumbnails of unknown sources and anything not named like an
+        easy_thumbnails thumbnail (like high resolution versions) are `foreign`.
+        """
+        if name in variants:
+            return variants[name]
+
+        key = unprofiled.get(strip_profile(name))
+        if key is not None:
+            return ('orphaned' if key[0] == 'orphaned' else 'profiled',) + key[1:]
+
+        if known and THUMBNAIL_NAME.search(name):
+            return 'orphaned', None, None
+
+        return 'foreign', None, None
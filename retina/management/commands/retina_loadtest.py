@@ -0,0 +1,41 @@
+from django.db import connections
+from django.core.management.base import BaseCommand
+from filer.models import Image as FilerImage
+
+from retina import manager
+from retina.loadtest import run
+
+
+class Command(BaseCommand):
+    help = 'Renders the srcset of filer images concurrently and reports throughput, latency and storage usage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('alias', nargs='?', default=None, help='Thumbnail alias, downscaling if omitted')
+        parser.add_argument('--sizes', nargs='+', default=None, help='Sizes passed to srcset')
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--iterations', type=int, default=1, help='How many times each worker renders each image')
+        parser.add_argument('--limit', type=int, default=50, help='Number of filer images to render')
+        parser.add_argument('--processes', action='store_true', default=False,
+                            help='Use processes instead of threads for the workers')
+
+    def handle(self, *args, **options):
+        files = list(FilerImage.objects.all()[:options['limit']])
+
+        if options['processes']:
+            # Forked workers must open their own database connections
+            connections.close_all()
+
+        result = run(files, alias=options['alias'], sizes=options['sizes'], workers=options['workers'],
+                     iterations=options['iterations'], processes=options['processes'], manager=manager)
+
+        self.stdout.write('Requests:          {} ({} errors)'.format(result['requests'], result['errors']))
+        self.stdout.write('Duration:          {:.2f}s'.format(result['duration']))
+        self.stdout.write('Throughput:        {:.1f} req/s'.format(result['throughput']))
+        self.stdout.write('Latency:           {}'.format(', '.join(
+            '{} {:.1f}ms'.format(key, value * 1000) for key, value in result['latency'].items())))
+        self.stdout.write('Renders:           {} ({} duplicates)'.format(
+            result['renders'], result['duplicate_renders']))
+
+        for operation, count in sorted(result['storage'].items()):
+            self.stdout.write('Storage {:<10} {} ({} errors)'.format(
+                operation + ':', count, result['storage_errors'].get(operation, 0)))
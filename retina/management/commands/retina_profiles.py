@@ -0,0 +1,47 @@
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand
+from filer.models import Image as FilerImage
+
+from retina import manager
+from retina.adapters.filer import FilerImageAdapter
+
+
+class Command(BaseCommand):
+    help = 'Reports how many bytes each density-aware encoder profile saves over the plain alias options'
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='Thumbnail aliases to report on, downscaling if omitted')
+        parser.add_argument('--density', type=int, default=None, help='Defaults to the density of the manager')
+
+    def handle(self, *args, **options):
+        density = options['density'] or manager.density
+        aliases = options['aliases'] or [None]
+        totals = OrderedDict()
+
+        for image in FilerImage.objects.iterator():
+            # Content hash adapters name their thumbnails differently, so we need the one actually in use
+            try:
+                adapter = manager.get_adapter(image)
+            except ValueError:
+                adapter = FilerImageAdapter
+
+            if not hasattr(adapter, 'profile_report'):
+                continue
+
+            for alias in aliases:
+                for entry in adapter.profile_report(image, alias, density, manager.get_profiles(alias)):
+                    key = (alias or '-', entry['density'], repr(sorted(entry['profile'].items())))
+                    total = totals.setdefault(key, {'count': 0, 'before': 0, 'after': 0})
+                    total['count'] += 1
+                    total['before'] += entry['before']
+                    total['after'] += entry['after']
+
+        if not totals:
+            self.stdout.write('No profiles configured')
+            return
+
+        for (alias, step, profile), total in totals.items():
+            self.stdout.write('{} @{} {}: {} files, {} -> {} bytes, {} bytes saved'.format(
+                alias, step, profile, total['count'], total['before'], total['after'],
+                total['before'] - total['after']))
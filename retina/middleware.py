@@ -0,0 +1,34 @@
+from django.utils.cache import patch_vary_headers
+
+from retina.hints import ClientHints, HEADERS, set_current, was_used
+
+
+class ClientHintsMiddleware(object):
+    """
+    Makes the client hints of the current request available to `File.client_hints`. Responses which made use
+    of them ask browsers to send them on subsequent requests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        set_current(ClientHints.from_meta(request.META))
+
+        try:
+            response = self.get_response(request)
+            used = was_used()
+        finally:
+            set_current(None)
+
+        # Everything else stays cacheable regardless of the hints
+        if not used:
+            return response
+
+        headers = [header for names in HEADERS.values() for header in names]
+        response['Accept-CH'] = ', '.join(headers)
+
+        # Responses differ based on the hints, so caches need to keep them apart
+        patch_vary_headers(response, headers)
+
+        return response
@@ -0,0 +1,28 @@
+import base64
+import io
+
+# Bounding box and JPEG quality of the inline micro-thumbnail. Anything bigger defeats the
+# purpose since the data uri ends up in every rendered page.
+LQIP_SIZE = (16, 16)
+LQIP_QUALITY = 40
+
+
+def lqip(image) -> str:
+    """
+    Returns a base64 encoded data uri of a tiny version of the given PIL image, meant to be
+    blurred by the browser and shown until the real image is loaded.
+    """
+    thumbnail = image.convert('RGB')
+    thumbnail.thumbnail(LQIP_SIZE)
+
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format='JPEG', quality=LQIP_QUALITY, optimize=True)
+
+    return 'data:image/jpeg;base64,{}'.format(base64.b64encode(buffer.getvalue()).decode('ascii'))
+
+
+def dominant_color(image) -> str:
+    """ Returns the average color of the given PIL image as a hex string like `#aabbcc` """
+    pixel = image.convert('RGB').resize((1, 1)).getpixel((0, 0))
+
+    return '#{:02x}{:02x}{:02x}'.format(*pixel)
@@ -0,0 +1,9 @@
+from django.conf.urls import url
+
+from retina import views
+
+app_name = 'retina'
+
+urlpatterns = [
+    url(r'^thumbnail/(?P<token>[^/]+)/$', views.thumbnail, name='thumbnail'),
+]
@@ -0,0 +1,30 @@
+from django.core import signing
+from django.http import Http404
+from django.shortcuts import get_object_or_404, redirect
+from filer.models import File as FilerFile, Image as FilerImage
+
+from retina import manager
+from retina.adapters.filer import FilerImageAdapter, FilerFileAdapter
+
+
+def thumbnail(request, token):
+    """
+    Renders a thumbnail which wasn't needed when the srcset was generated and redirects to it. The token is
+    signed, so nobody can make us render arbitrary thumbnails.
+    """
+    try:
+        data = signing.loads(token, salt='retina.thumbnail')
+    except signing.BadSignature:
+        raise Http404
+
+    file = get_object_or_404(FilerFile, pk=data['pk'])
+
+    try:
+        adapter = manager.get_adapter(file)
+    except ValueError:
+        adapter = FilerImageAdapter if isinstance(file, FilerImage) else FilerFileAdapter
+
+    # Json turned the size tuple into a list
+    options = dict(data['options'], size=tuple(data['options']['size']))
+
+    return redirect(adapter.render(file, options))
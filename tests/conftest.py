@@ -2,7 +2,8 @@ from typing import Optional
 
 import pytest
 
-from retina import ImageAdapterContract, Manager, SupportsRetina, File
+from retina import ImageAdapterContract, Manager, SupportsRetina, SupportsPlaceholder, \
+    SupportsClientHints, File, get_profile
 
 
 class DummyAdapter(ImageAdapterContract):
@@ -22,7 +23,7 @@ class DummyAdapter(ImageAdapterContract):
 class DummyAdapterRetina(SupportsRetina, ImageAdapterContract):
 
     @staticmethod
-    def retina(file, alias: Optional[str] = None, density: Optional[int] = 0) -> list:
+    def retina(file, alias: Optional[str] = None, density: Optional[int] = 0, profiles: Optional[dict] = None) -> list:
         ret = []
         if alias:
             for i in range(0, density):
@@ -31,6 +32,9 @@ class DummyAdapterRetina(SupportsRetina, ImageAdapterContract):
             for i in range(0, density):
                 ret.append('dummyfile_density_{}.file'.format(i + 1))
 
+        if profiles:
+            ret = ['{}.q{}'.format(url, get_profile(profiles, i + 1).get('quality')) for i, url in enumerate(ret)]
+
         return ret
 
     @staticmethod
@@ -42,6 +46,43 @@ class DummyAdapterRetina(SupportsRetina, ImageAdapterContract):
         return 'alt'
 
 
+class DummyAdapterPlaceholder(SupportsPlaceholder, DummyAdapterRetina):
+
+    @staticmethod
+    def placeholder(file, alias: Optional[str] = None, density: Optional[int] = 0,
+                    profiles: Optional[dict] = None) -> dict:
+        return {
+            'lqip': 'data:{}'.format(alias),
+            'color': '#000000',
+            'dimensions': [[i + 1, i + 1] for i in range(0, density)],
+        }
+
+
+class DummyAdapterClientHints(SupportsClientHints, DummyAdapterRetina):
+
+    @staticmethod
+    def retina(file, alias: Optional[str] = None, density: Optional[int] = 0, profiles: Optional[dict] = None,
+               hints=None) -> list:
+        ret = DummyAdapterRetina.retina(file, alias=alias, density=density, profiles=profiles)
+
+        if hints:
+            densities = hints.densities(density)
+            ret = [url if i + 1 in densities else 'lazy.{}'.format(url) for i, url in enumerate(ret)]
+
+        return ret
+
+
+class DummyAdapterClientHintsPlaceholder(SupportsPlaceholder, DummyAdapterClientHints):
+
+    @staticmethod
+    def placeholder(file, alias: Optional[str] = None, density: Optional[int] = 0, profiles: Optional[dict] = None,
+                    hints=None) -> dict:
+        placeholder = DummyAdapterPlaceholder.placeholder(file, alias=alias, density=density, profiles=profiles)
+        placeholder['dpr'] = hints.dpr if hints else None
+
+        return placeholder
+
+
 @pytest.fixture(scope='function')
 def manager():
     manager = Manager()
@@ -1,7 +1,16 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# A file instead of an in-memory database, so threads started by the tests (e.g. load tests) see the same tables
+_database_dir = tempfile.mkdtemp(prefix='retina-tests-')
+atexit.register(shutil.rmtree, _database_dir, True)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': ':memory:',
+        'NAME': os.path.join(_database_dir, 'db.sqlite3'),
     }
 }
 
@@ -0,0 +1,52 @@
+import io
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from filer.utils.filer_easy_thumbnails import FilerThumbnailer
+from PIL import Image
+
+
+def setup_database():
+    """ easy_thumbnails keeps track of sources and thumbnails in the database """
+    call_command('migrate', verbosity=0)
+
+
+class SourceFile(io.BytesIO):
+    """ Mimics the file field of a filer file, which thumbnailers can read the source from """
+
+    def __init__(self, name, storage):
+        with storage.open(name) as fh:
+            super().__init__(fh.read())
+        self.name = name
+        self.source_storage = storage
+        self.thumbnail_storage = storage
+        self.thumbnail_basedir = 'thumbs'
+
+
+class SourceImage(object):
+    """
+    Stand-in for a filer image which is stored in the given storage and uses the real filer thumbnailer, so
+    we can render actual thumbnails without the filer models and their storages.
+    """
+
+    def __init__(self, storage, name='images/image.jpg', size=(400, 200), pk=1, sha1='', is_public=True,
+                 subject_location=None):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (255, 0, 0)).save(buffer, format='JPEG')
+        name = storage.save(name, ContentFile(buffer.getvalue()))
+
+        self.pk = pk
+        self.file = SourceFile(name, storage)
+        self.width, self.height = size
+        self.sha1 = sha1
+        self.is_public = is_public
+        self.subject_location = subject_location
+        self.url = storage.url(name)
+
+    @property
+    def easy_thumbnails_thumbnailer(self):
+        return FilerThumbnailer(
+            file=None, name=self.file.name,
+            source_storage=self.file.source_storage,
+            thumbnail_storage=self.file.thumbnail_storage,
+            thumbnail_basedir=self.file.thumbnail_basedir)
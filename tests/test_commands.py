@@ -0,0 +1,299 @@
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.django_settings')
+django.setup()
+
+import io
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from easy_thumbnails import models as easy_thumbnails_models
+from filer import settings as filer_settings
+
+from retina import Manager
+from retina.adapters.filer import FilerImageAdapter, ContentHashFilerImageAdapter
+from retina.management.commands.retina_gc import walk, strip_profile, Command
+from retina.management.commands.retina_profiles import Command as ProfilesCommand
+from tests.helpers import setup_database, SourceImage
+
+ALIASES = {'foo': {'size': (100, 100), 'crop': True}}
+
+
+def test_walk():
+    tree = {
+        'thumbs': (['a', 'b'], ['x.jpg']),
+        'thumbs/a': ([], ['y.jpg', 'z.jpg']),
+        'thumbs/b': (['c'], []),
+        'thumbs/b/c': ([], ['w.jpg']),
+    }
+    storage = MagicMock(name='Storage')
+    storage.listdir.side_effect = lambda path: tree[path]
+
+    # walk must be lazy, so the storage isn't touched before we start iterating
+    result = walk(storage, 'thumbs')
+    storage.listdir.assert_not_called()
+
+    assert list(result) == [
+        ('thumbs', ['x.jpg']),
+        ('thumbs/a', ['y.jpg', 'z.jpg']),
+        ('thumbs/b', []),
+        ('thumbs/b/c', ['w.jpg']),
+    ]
+
+
+def test_strip_profile():
+    assert strip_profile('thumbs/a.jpg__100x100_q50_crop_subsampling-2.jpg') == 'thumbs/a.jpg__100x100_crop.jpg'
+    assert strip_profile('thumbs/a.jpg__100x100_q85.jpg.retina2.json') == 'thumbs/a.jpg__100x100.jpg.retina2.json'
+    assert strip_profile('thumbs/a.jpg__100x100_q85@2x.jpg') == 'thumbs/a.jpg__100x100@2x.jpg'
+
+
+class RemoteStorage(Storage):
+    """
+    Stores its files locally, but lacks `path` like any remote storage. easy_thumbnails therefore relies on its
+    database cache to tell whether thumbnails exist.
+    """
+
+    def __init__(self, location):
+        self.local = FileSystemStorage(location=location)
+
+    def _open(self, name, mode='rb'):
+        return self.local._open(name, mode)
+
+    def _save(self, name, content):
+        return self.local._save(name, content)
+
+    def delete(self, name):
+        return self.local.delete(name)
+
+    def exists(self, name):
+        return self.local.exists(name)
+
+    def listdir(self, path):
+        return self.local.listdir(path)
+
+    def size(self, name):
+        return self.local.size(name)
+
+    def url(self, name):
+        return self.local.url(name)
+
+    def get_modified_time(self, name):
+        return self.local.get_modified_time(name)
+
+
+@pytest.fixture
+def gc(request, tmpdir):
+    """ Patches the command to collect the thumbnails of images stored in a temporary storage """
+    setup_database()
+    cache.clear()
+    storage = getattr(request, 'param', FileSystemStorage)(location=str(tmpdir))
+    aliases = dict(ALIASES)
+    files = []
+
+    manager = Manager()
+    manager.update_adapters({SourceImage: FilerImageAdapter})
+    manager.update_density(2)
+
+    settings_mock = MagicMock(name='filer_settings', FILER_ADMIN_ICON_SIZES=filer_settings.FILER_ADMIN_ICON_SIZES)
+    settings_mock.FILER_PUBLICMEDIA_THUMBNAIL_STORAGE = storage
+    settings_mock.FILER_PUBLICMEDIA_THUMBNAIL_OPTIONS = {'base_dir': 'thumbs'}
+    settings_mock.FILER_PRIVATEMEDIA_THUMBNAIL_STORAGE = storage
+    settings_mock.FILER_PRIVATEMEDIA_THUMBNAIL_OPTIONS = {'base_dir': 'private'}
+
+    def filter(file=None, sha1=None):
+        return [f for f in files if (file and f.file.name == file) or (sha1 and f.sha1 == sha1)]
+
+    module = 'retina.management.commands.retina_gc'
+    with mock.patch(module + '.manager', manager), \
+            mock.patch(module + '.filer_settings', settings_mock), \
+            mock.patch(module + '.FilerImage', SourceImage), \
+            mock.patch(module + '.FilerFile') as filer_file_mock, \
+            mock.patch('retina.adapters.filer.aliases') as aliases_mock:
+        filer_file_mock.objects.filter.side_effect = filter
+        aliases_mock.all.return_value = aliases
+        aliases_mock.get.side_effect = aliases.get
+        yield storage, files, manager, aliases
+
+
+def run_gc(**options):
+    stdout = io.StringIO()
+    call_command(Command(), stdout=stdout, **options)
+    return stdout.getvalue()
+
+
+def parse_totals(output: str) -> dict:
+    return {line.split(':')[0]: int(line.split(': ')[1].split()[0]) for line in output.splitlines() if ': ' in line}
+
+
+def test_retina_gc(gc):
+    storage, files, manager, aliases = gc
+    image = SourceImage(storage, size=(400, 200))
+    files.append(image)
+    thumbnailer = FilerImageAdapter.thumbnailer(image)
+
+    # Rendered with a density of 3 by a single file, as well as its placeholder
+    FilerImageAdapter.retina(image, 'foo', density=3)
+    FilerImageAdapter.placeholder(image, 'foo', density=3)
+    FilerImageAdapter.placeholder(image, 'foo', density=2)
+    # @2 of a single file with another profile
+    thumbnailer.get_thumbnail({'size': (200, 200), 'crop': True, 'quality': 50})
+    # Nothing retina renders with the current aliases, like {% thumbnail %} output
+    thumbnailer.get_thumbnail({'size': (123, 45)})
+    # Not named like any thumbnail easy_thumbnails renders for filer
+    storage.save('thumbs/images/image.jpg__100x100_q85_crop_subsampling-2@2x.jpg', ContentFile(b'foo'))
+    storage.save('thumbs/images/notes.txt', ContentFile(b'foo'))
+
+    def names():
+        return sorted(storage.listdir('thumbs/images')[1])
+
+    before = names()
+    output = run_gc(densities=[2])
+    assert names() == before
+
+    assert parse_totals(output) == {
+        'foo @1': 1,
+        'foo @2': 1,
+        'foo placeholders': 1,
+        'orphaned foo @3': 1,
+        'orphaned foo placeholders': 1,
+        'orphaned': 1,
+        'profiled foo @2': 1,
+        'foreign': 1,
+    }
+    assert output.splitlines()[-1].startswith('Found 3 thumbnails, ')
+
+    # Deleting needs the densities to be passed explicitly, single files might use others than the manager
+    with pytest.raises(CommandError):
+        run_gc(delete=True)
+
+    output = run_gc(densities=[2], delete=True, verbosity=2)
+    deleted = [
+        'image.jpg__300x300_q85_crop_subsampling-2.jpg',
+        'image.jpg__100x100_q85_crop_subsampling-2.jpg.retina3.json',
+        'image.jpg__123x45_q85_subsampling-2.jpg',
+    ]
+    for name in deleted:
+        assert 'Deleted thumbs/images/' + name in output
+    assert output.splitlines()[-1].startswith('Deleted 3 thumbnails, ')
+    assert names() == [name for name in before if name not in deleted]
+
+    run_gc(densities=[2], delete=True, prune_profiles=True)
+    assert 'image.jpg__200x200_q50_crop_subsampling-2.jpg' not in names()
+    assert 'image.jpg__200x200_q85_crop_subsampling-2.jpg' in names()
+    assert 'image.jpg__100x100_q85_crop_subsampling-2@2x.jpg' in names()
+    assert 'notes.txt' in names()
+
+    # Changing an alias orphans every thumbnail of its old size
+    aliases['foo'] = {'size': (120, 120), 'crop': True}
+    output = run_gc(densities=[2])
+    assert parse_totals(output) == {'orphaned': 3, 'foreign': 1}
+
+    # Thumbnails of unknown sources are left alone
+    files.remove(image)
+    run_gc(densities=[2], delete=True)
+    assert 'image.jpg__200x200_q85_crop_subsampling-2.jpg' in names()
+
+    files.append(image)
+    run_gc(densities=[2], delete=True)
+    assert names() == ['image.jpg__100x100_q85_crop_subsampling-2@2x.jpg', 'notes.txt']
+
+
+@pytest.mark.parametrize('gc', [RemoteStorage], indirect=True)
+def test_retina_gc_remote_storage(gc):
+    storage, files, manager, aliases = gc
+    image = SourceImage(storage, size=(400, 200))
+    files.append(image)
+
+    urls = FilerImageAdapter.retina(image, 'foo', density=3)
+    run_gc(densities=[2], delete=True)
+    assert not storage.exists('thumbs/images/image.jpg__300x300_q85_crop_subsampling-2.jpg')
+
+    # Remote storages rely on the database to tell whether a thumbnail exists, so it must be gone there as well
+    assert not easy_thumbnails_models.Thumbnail.objects.filter(
+        name='thumbs/images/image.jpg__300x300_q85_crop_subsampling-2.jpg').exists()
+    assert FilerImageAdapter.retina(image, 'foo', density=3) == urls
+    assert storage.exists('thumbs/images/image.jpg__300x300_q85_crop_subsampling-2.jpg')
+
+
+def test_retina_gc_variants(gc):
+    storage, files, manager, aliases = gc
+    manager.update_adapters({SourceImage: ContentHashFilerImageAdapter})
+    files.append(SourceImage(storage, name='images/a.jpg', size=(400, 200), sha1='abcdef'))
+    files.append(SourceImage(storage, name='images/b.jpg', size=(400, 200), sha1='abcdef', pk=2))
+
+    variants = Command().variants('retina/ab/abcdef.jpg', [2])
+    assert variants['thumbs/retina/ab/abcdef.jpg__100x100_q85_crop_subsampling-2.jpg'] == ('reachable', 'foo', 1)
+    assert variants['thumbs/retina/ab/abcdef.jpg__200x200_q85_crop_subsampling-2.png'] == ('reachable', 'foo', 2)
+    assert variants['thumbs/retina/ab/abcdef.jpg__300x300_q85_crop_subsampling-2.jpg'] == ('orphaned', 'foo', 3)
+    assert variants['thumbs/retina/ab/abcdef.jpg__100x100_q85_crop_subsampling-2.jpg.retina2.json'] == \
+        ('reachable', 'foo', 0)
+    assert variants['thumbs/retina/ab/abcdef.jpg__200x100_q85_subsampling-2.jpg'] == ('reachable', None, 1)
+
+    # Filer renders its admin thumbnails from the original path
+    assert ('filer', None, None) in variants.values()
+    assert all(name.startswith('thumbs/retina/') for name, key in variants.items() if key[0] != 'filer')
+
+    # Shared thumbnails of files which no longer exist aren't reachable anymore
+    assert Command().variants('retina/12/123456.jpg', [2]) == {}
+
+
+def test_retina_gc_content_hash(gc):
+    storage, files, manager, aliases = gc
+    manager.update_adapters({SourceImage: ContentHashFilerImageAdapter})
+    first = SourceImage(storage, name='images/a.jpg', size=(400, 200), sha1='abcdef')
+    second = SourceImage(storage, name='images/b.jpg', size=(400, 200), sha1='abcdef', pk=2)
+    files.extend([first, second])
+
+    ContentHashFilerImageAdapter.retina(first, 'foo', density=2)
+    ContentHashFilerImageAdapter.retina(second, 'foo', density=2)
+    storage.save('thumbs/retina/ab/abcdef.jpg__100x100_q85_crop_subsampling-2@2x.jpg', ContentFile(b'foo'))
+
+    def names():
+        return sorted(storage.listdir('thumbs/retina/ab')[1])
+
+    # Shared thumbnails are kept as long as any of the uploads is left
+    files.remove(first)
+    assert 'orphaned' not in parse_totals(run_gc(densities=[2], delete=True))
+    assert len(names()) == 3
+
+    # Filer doesn't know about them, so they're collected once the last one is gone
+    files.remove(second)
+    assert parse_totals(run_gc(densities=[2], delete=True)) == {'orphaned': 2, 'foreign': 1}
+    assert names() == ['abcdef.jpg__100x100_q85_crop_subsampling-2@2x.jpg']
+
+
+def test_retina_profiles(tmpdir):
+    setup_database()
+    storage = FileSystemStorage(location=str(tmpdir))
+    image = SourceImage(storage, size=(400, 200), sha1='abcdef')
+
+    manager = Manager()
+    manager.update_adapters({SourceImage: ContentHashFilerImageAdapter})
+    manager.update_profiles({2: {'quality': 50}})
+
+    module = 'retina.management.commands.retina_profiles'
+    with mock.patch(module + '.manager', manager), \
+            mock.patch(module + '.FilerImage') as filer_image_mock, \
+            mock.patch('retina.adapters.filer.aliases') as aliases_mock, \
+            mock.patch.object(ContentHashFilerImageAdapter, 'profile_report',
+                              wraps=ContentHashFilerImageAdapter.profile_report) as report_mock:
+        filer_image_mock.objects.iterator.return_value = [image]
+        aliases_mock.get.side_effect = ALIASES.get
+
+        stdout = io.StringIO()
+        call_command(ProfilesCommand(), 'foo', density=3, stdout=stdout)
+
+    # The adapter of the manager is used, so content hash names are reported on
+    report_mock.assert_called_once_with(image, 'foo', 3, {2: {'quality': 50}})
+    assert stdout.getvalue().startswith("foo @2 [('quality', 50)]: 1 files, ")
+
+    # Reporting renders in memory only
+    assert not storage.exists('thumbs')
@@ -2,22 +2,34 @@ from unittest import mock
 
 import pytest
 
-from retina import File, Manager, ManagerContract, ImageAdapterContract, SupportsRetina
-from tests.conftest import DummyAdapter, DummyAdapterRetina
+from retina import File, Manager, ManagerContract, ImageAdapterContract, SupportsRetina, SupportsPlaceholder, \
+    get_profile
+from retina.hints import ClientHints, set_current, was_used
+from tests.conftest import DummyAdapter, DummyAdapterRetina, DummyAdapterPlaceholder, DummyAdapterClientHints, \
+    DummyAdapterClientHintsPlaceholder
 
 
 def test_manager(raw_manager):
     # Assert manager default settings
     assert len(raw_manager._adapters) == 0
     assert raw_manager.density == 2
+    assert raw_manager.profiles == {}
+    assert raw_manager.alias_profiles == {}
+    assert raw_manager.client_hints is False
 
     raw_manager.update_adapters({str: DummyAdapter})
     raw_manager.update_density(99)
+    raw_manager.update_profiles({2: {'quality': 50}})
+    raw_manager.update_alias_profiles({'foo': {3: {'quality': 40}}})
+    raw_manager.update_client_hints(True)
     adapter = raw_manager.get_adapter('foo.bar')
 
     # Assert mutated data on manager
     assert len(raw_manager._adapters) == 1
     assert raw_manager.density == 99
+    assert raw_manager.profiles == {2: {'quality': 50}}
+    assert raw_manager.alias_profiles == {'foo': {3: {'quality': 40}}}
+    assert raw_manager.client_hints is True
     assert adapter == DummyAdapter
 
 
@@ -26,6 +38,7 @@ def test_not_implemented_exceptions():
     manager = ManagerContract()
     adapter = ImageAdapterContract()
     adapter_retina = SupportsRetina()
+    adapter_placeholder = SupportsPlaceholder()
 
     with pytest.raises(NotImplementedError):
         manager.get_adapter(filer_image)
@@ -39,6 +52,9 @@ def test_not_implemented_exceptions():
     with pytest.raises(NotImplementedError):
         adapter_retina.retina(filer_image)
 
+    with pytest.raises(NotImplementedError):
+        adapter_placeholder.placeholder(filer_image)
+
 
 def test_invalid_adapter(raw_manager):
     # raw_manager has no adapters set
@@ -54,6 +70,10 @@ def test_file_init(manager):
     assert file._density == 2
     assert file._manager == manager
     assert file._additional == {}
+    assert file._placeholder is False
+    assert file._profiles == {}
+    assert file._client_hints is False
+    assert file._hints is None
 
 
 def test_file_density(file):
@@ -62,6 +82,28 @@ def test_file_density(file):
     assert file._density == 99
 
 
+def test_file_profiles(file):
+    ret = file.profiles({2: {'quality': 50}})
+    assert ret == file
+    assert file._profiles == {2: {'quality': 50}}
+
+
+def test_get_profile():
+    profiles = {2: {'quality': 70}, 4: {'quality': 40, 'subsampling': 2}}
+
+    assert get_profile(None, 2) == {}
+    assert get_profile({}, 2) == {}
+    assert get_profile(profiles, 1) == {}
+    assert get_profile(profiles, 2) == {'quality': 70}
+    assert get_profile(profiles, 3) == {'quality': 70}
+    assert get_profile(profiles, 4) == {'quality': 40, 'subsampling': 2}
+    assert get_profile(profiles, 9) == {'quality': 40, 'subsampling': 2}
+
+    # Must return a copy, callers are free to alter it
+    get_profile(profiles, 2)['quality'] = 10
+    assert profiles[2] == {'quality': 70}
+
+
 def test_file_additional(file):
     ret = file.additional(foo='bar')
     assert ret == file
@@ -119,3 +161,124 @@ def test_srcset_retina():
     ret = file.srcset()
     assert ret == {'urls': {'default': ['dummyfile_density_1.file', 'dummyfile_density_2.file']}, 'alt': 'alt',
                    'foo': 'bar'}
+
+
+def test_srcset_placeholder():
+    manager = Manager()
+    manager.update_adapters({str: DummyAdapterPlaceholder})
+    file = File('dummy.file', manager=manager)
+
+    # Placeholders are opt-in
+    ret = file.srcset(alias='foo')
+    assert 'placeholders' not in ret
+
+    ret = file.placeholder()
+    assert ret == file
+    assert file._placeholder is True
+
+    ret = file.srcset(alias='foo', sizes=['size1', 'size2'])
+    assert ret['placeholders'] == {
+        'size1': {'lqip': 'data:foo_size1', 'color': '#000000', 'dimensions': [[1, 1], [2, 2]]},
+        'size2': {'lqip': 'data:foo_size2', 'color': '#000000', 'dimensions': [[1, 1], [2, 2]]},
+    }
+
+    # Adapters without placeholder support simply don't return any
+    manager.update_adapters({str: DummyAdapterRetina})
+    ret = File('dummy.file', manager=manager).placeholder().srcset(alias='foo')
+    assert 'placeholders' not in ret
+
+
+def test_srcset_profiles():
+    manager = Manager()
+    manager.update_adapters({str: DummyAdapterRetina})
+    manager.update_profiles({2: {'quality': 50}})
+
+    ret = File('dummy.file', manager=manager).srcset(alias='foo')
+    assert ret['urls'] == {'default': ['dummyfile_density_1.foo.file.qNone', 'dummyfile_density_2.foo.file.q50']}
+
+    ret = File('dummy.file', manager=manager).profiles({1: {'quality': 80}}).srcset(alias='foo')
+    assert ret['urls'] == {'default': ['dummyfile_density_1.foo.file.q80', 'dummyfile_density_2.foo.file.q80']}
+
+    # The curve of an alias replaces the one of the manager or the file as a whole
+    manager.update_alias_profiles({'foo_sm': {1: {'quality': 70}}})
+    manager.update_profiles({2: {'quality': 50}, 3: {'quality': 30}})
+    ret = File('dummy.file', manager=manager).srcset(alias='foo', sizes=['sm', 'lg'])
+    assert ret['urls'] == {
+        'sm': ['dummyfile_density_1.foo_sm.file.q70', 'dummyfile_density_2.foo_sm.file.q70'],
+        'lg': ['dummyfile_density_1.foo_lg.file.qNone', 'dummyfile_density_2.foo_lg.file.q50'],
+    }
+
+    ret = File('dummy.file', manager=manager).profiles({1: {'quality': 80}}).srcset(alias='foo', sizes=['sm'])
+    assert ret['urls'] == {'sm': ['dummyfile_density_1.foo_sm.file.q70', 'dummyfile_density_2.foo_sm.file.q70']}
+
+
+def test_manager_get_profiles():
+    manager = Manager()
+    manager.update_profiles({2: {'quality': 50}})
+    manager.update_alias_profiles({'foo': {3: {'quality': 30}}})
+
+    assert manager.get_profiles() == {2: {'quality': 50}}
+    assert manager.get_profiles('bar') == {2: {'quality': 50}}
+    assert manager.get_profiles('bar', {2: {'quality': 60}}) == {2: {'quality': 60}}
+
+    # Densities the alias curve leaves out aren't filled in from the other one
+    assert manager.get_profiles('foo') == {3: {'quality': 30}}
+    assert manager.get_profiles('foo', {2: {'quality': 60}}) == {3: {'quality': 30}}
+
+
+def test_srcset_client_hints():
+    manager = Manager()
+    manager.update_adapters({str: DummyAdapterClientHints})
+    file = File('dummy.file', manager=manager)
+
+    # Client hints are opt-in
+    set_current(ClientHints(dpr=2))
+    try:
+        ret = file.srcset(alias='foo')
+        assert ret['urls'] == {'default': ['dummyfile_density_1.foo.file', 'dummyfile_density_2.foo.file']}
+        assert was_used() is False
+
+        ret = file.client_hints()
+        assert ret == file
+        assert file._client_hints is True
+
+        # Falls back to the hints of the current request
+        ret = file.srcset(alias='foo')
+        assert ret['urls'] == {'default': ['lazy.dummyfile_density_1.foo.file', 'dummyfile_density_2.foo.file']}
+        assert was_used() is True
+
+        # Explicitly passed hints take precedence and don't make the response depend on the request
+        set_current(ClientHints(dpr=2))
+        ret = file.client_hints(hints=ClientHints(dpr=1)).srcset(alias='foo')
+        assert ret['urls'] == {'default': ['dummyfile_density_1.foo.file', 'lazy.dummyfile_density_2.foo.file']}
+        assert was_used() is False
+
+        # Even a request without any hints gets marked, its response would differ with them
+        set_current(ClientHints())
+        file.client_hints().srcset(alias='foo')
+        assert was_used() is True
+    finally:
+        set_current(None)
+
+    # Without any hints everything gets rendered
+    ret = file.client_hints().srcset(alias='foo')
+    assert ret['urls'] == {'default': ['dummyfile_density_1.foo.file', 'dummyfile_density_2.foo.file']}
+
+    # Enabled on the manager, adapters without client hint support are left alone
+    manager.update_client_hints(True)
+    manager.update_adapters({str: DummyAdapterRetina})
+    ret = File('dummy.file', manager=manager).client_hints(hints=ClientHints(dpr=1)).srcset(alias='foo')
+    assert ret['urls'] == {'default': ['dummyfile_density_1.foo.file', 'dummyfile_density_2.foo.file']}
+
+
+def test_srcset_client_hints_placeholder():
+    manager = Manager()
+    manager.update_adapters({str: DummyAdapterClientHintsPlaceholder})
+    file = File('dummy.file', manager=manager).placeholder()
+
+    # Placeholders get the same hints, so they can be built from the density which is rendered anyway
+    ret = file.client_hints(hints=ClientHints(dpr=2)).srcset(alias='foo')
+    assert ret['placeholders']['default']['dpr'] == 2
+
+    ret = file.client_hints(False).srcset(alias='foo')
+    assert ret['placeholders']['default']['dpr'] is None
@@ -1,3 +1,4 @@
+import io
 import os
 
 import django
@@ -10,9 +11,18 @@ from unittest import mock
 from unittest.mock import MagicMock, PropertyMock, call
 
 from doublex import Spy, property_got, assert_that, Stub
-from filer.models import Image as FilerImage
+from PIL import Image
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.test import override_settings
+from easy_thumbnails import processors
+from filer.models import File as FilerFile, Image as FilerImage
 
-from retina.adapters.filer import FilerImageAdapter
+from retina import Manager, ClientHints
+from retina.adapters.filer import FilerImageAdapter, FilerFileAdapter, ContentHashFilerImageAdapter, \
+    ContentHashFilerFileAdapter, ContentHashThumbnailer, content_hash_name
+from tests.helpers import setup_database, SourceImage
 
 
 def test_url_without_alias():
@@ -45,18 +55,18 @@ def test_url_with_alias(get_thumbnailer_mock):
 def test_retina_without_alias(downscale_mock):
     filer_image = Stub(FilerImage)
     FilerImageAdapter().retina(filer_image)
-    downscale_mock.assert_called_with(filer_image, 1)
+    downscale_mock.assert_called_with(filer_image, 1, None, None)
     FilerImageAdapter().retina(filer_image, density=2)
-    downscale_mock.assert_called_with(filer_image, 2)
+    downscale_mock.assert_called_with(filer_image, 2, None, None)
 
 
 @mock.patch('retina.adapters.filer.FilerImageAdapter.retina_upscale')
 def test_retina_with_alias(upscale_mock):
     filer_image = Stub(FilerImage)
     FilerImageAdapter().retina(filer_image, alias='foo')
-    upscale_mock.assert_called_with(filer_image, 'foo', 1)
+    upscale_mock.assert_called_with(filer_image, 'foo', 1, None, None)
     FilerImageAdapter().retina(filer_image, alias='foo', density=2)
-    upscale_mock.assert_called_with(filer_image, 'foo', 2)
+    upscale_mock.assert_called_with(filer_image, 'foo', 2, None, None)
 
 
 @mock.patch('retina.adapters.filer.get_thumbnailer')
@@ -94,6 +104,16 @@ def test_retina_upscale(aliases_mock, get_thumbnailer_mock):
         call({'size': (600, 600), 'subject_location': (1, 1)}),
     ])
 
+    # Test density profiles
+    filer_image.subject_location = None
+    thumbnailer_mock.reset_mock()
+    FilerImageAdapter().retina_upscale(filer_image, density=3, profiles={2: {'quality': 60}})
+    thumbnailer_mock.get_thumbnail.assert_has_calls([
+        call({'size': (300, 300)}),
+        call({'size': (600, 600), 'quality': 60}),
+        call({'size': (900, 900), 'quality': 60}),
+    ])
+
     aliases_mock.get.return_value = {}
     with pytest.raises(KeyError):
         FilerImageAdapter().retina_upscale(filer_image, density=3)
@@ -168,3 +188,294 @@ def test_alt_return():
     assert result == 'foo'
     # It's 2 because once for checking if the attribute exists and once for returning it
     assert original_filename.call_count == 2
+
+
+@mock.patch('retina.adapters.filer.cache')
+@mock.patch('retina.adapters.filer.get_thumbnailer')
+@mock.patch('retina.adapters.filer.aliases')
+def test_placeholder(aliases_mock, get_thumbnailer_mock, cache_mock):
+    filer_image = mock.Mock(name='FilerImage', sha1='abc', subject_location=None, width=300, height=300)
+    filer_image.file.name = 'foo.jpg'
+
+    content = io.BytesIO()
+    Image.new('RGB', (300, 300), (255, 0, 0)).save(content, format='PNG')
+
+    storage_mock = MagicMock(name='Storage')
+    storage_mock.exists.return_value = False
+    storage_mock.open.side_effect = lambda name: io.BytesIO(content.getvalue())
+
+    thumbnailer_mock = MagicMock(name='Thumbnailer', thumbnail_storage=storage_mock)
+    thumbnailer_mock.get_thumbnail.return_value = MagicMock(name='Thumbnail')
+    thumbnailer_mock.get_thumbnail_name.return_value = 'foo.jpg__300x300.jpg'
+    get_thumbnailer_mock.return_value = thumbnailer_mock
+    aliases_mock.get.return_value = {'size': (300, 300)}
+    cache_mock.get.return_value = None
+
+    result = FilerImageAdapter().placeholder(filer_image, alias='foo', density=2)
+    assert result['color'] == '#ff0000'
+    assert result['lqip'].startswith('data:image/jpeg;base64,')
+    assert result['dimensions'] == [[300, 300], [300, 300]]
+
+    # Only the base thumbnail gets rendered
+    thumbnailer_mock.get_thumbnail.assert_called_once_with({'size': (300, 300)})
+
+    # Persisted next to the base thumbnail and in the cache
+    assert storage_mock.save.call_args[0][0] == 'foo.jpg__300x300.jpg.retina2.json'
+    cache_mock.set.assert_called_once_with(cache_mock.get.call_args[0][0], result, None)
+
+    # Once cached, nothing gets rendered or read anymore
+    thumbnailer_mock.reset_mock()
+    storage_mock.reset_mock()
+    cache_mock.get.return_value = result
+    assert FilerImageAdapter().placeholder(filer_image, alias='foo', density=2) == result
+    thumbnailer_mock.get_thumbnail.assert_not_called()
+    storage_mock.open.assert_not_called()
+
+
+@pytest.mark.parametrize('options', [
+    {'size': (100, 100)},
+    {'size': (100, 100), 'crop': True},
+    {'size': (100, 0)},
+    {'size': (0, 150)},
+    {'size': (800, 800)},
+    {'size': (800, 800), 'upscale': True},
+    {'size': (300, 300), 'crop': True},
+    {'size': (300, 300), 'crop': True, 'upscale': True},
+    {'size': (300, 300), 'crop': 'scale'},
+    {'size': (100, 100), 'zoom': 40},
+    {'size': (333, 77), 'crop': True, 'zoom': 10, 'upscale': True},
+])
+def test_thumbnail_dimensions(options):
+    image = processors.scale_and_crop(Image.new('RGB', (400, 200)), **options)
+    assert FilerImageAdapter.thumbnail_dimensions((400, 200), options) == list(image.size)
+
+
+@mock.patch('retina.adapters.filer.aliases')
+def test_placeholder_rendered(aliases_mock, tmpdir):
+    setup_database()
+    storage = FileSystemStorage(location=str(tmpdir))
+    image = SourceImage(storage, size=(400, 200), sha1='abc')
+    aliases_mock.get.return_value = {'size': (100, 100), 'crop': True}
+
+    cache.clear()
+    result = FilerImageAdapter.placeholder(image, alias='foo', density=3)
+    assert result['color'] in ('#ff0000', '#fe0000')
+    assert result['lqip'].startswith('data:image/jpeg;base64,')
+    assert result['dimensions'] == [[100, 100], [200, 200], [300, 200]]
+
+    # Only the base thumbnail gets rendered, the other densities are computed
+    thumbnailer = FilerImageAdapter.thumbnailer(image)
+    assert storage.exists(FilerImageAdapter.thumbnail_name(thumbnailer, {'size': (100, 100), 'crop': True}))
+    assert not storage.exists(FilerImageAdapter.thumbnail_name(thumbnailer, {'size': (200, 200), 'crop': True}))
+
+    # With the base thumbnail already in place and neither the cache nor the sidecar available
+    cache.clear()
+    for name in storage.listdir('thumbs/images')[1]:
+        if name.endswith('.json'):
+            storage.delete('thumbs/images/' + name)
+    assert FilerImageAdapter.placeholder(image, alias='foo', density=3) == result
+
+    # Changing the alias changes the key, so nothing stale is returned
+    aliases_mock.get.return_value = {'size': (50, 50), 'crop': True}
+    assert FilerImageAdapter.placeholder(image, alias='foo', density=2)['dimensions'] == [[50, 50], [100, 100]]
+
+    # Downscaling ends with the original
+    assert FilerImageAdapter.placeholder(image, density=2)['dimensions'] == [[200, 100], [400, 200]]
+
+
+@mock.patch('retina.adapters.filer.aliases')
+def test_placeholder_client_hints(aliases_mock, tmpdir):
+    setup_database()
+    storage = FileSystemStorage(location=str(tmpdir))
+    image = SourceImage(storage, size=(400, 200), sha1='abc')
+    aliases_mock.get.return_value = {'size': (100, 100), 'crop': True}
+    thumbnailer = FilerImageAdapter.thumbnailer(image)
+
+    # Built from the @2 version the client gets anyway, the @1 version stays lazy
+    cache.clear()
+    result = FilerImageAdapter.placeholder(image, alias='foo', density=3, hints=ClientHints(dpr=2))
+    assert result['color'] in ('#ff0000', '#fe0000')
+    assert result['dimensions'] == [[100, 100], [200, 200], [300, 200]]
+    assert not storage.exists(FilerImageAdapter.thumbnail_name(thumbnailer, {'size': (100, 100), 'crop': True}))
+    assert storage.exists(FilerImageAdapter.thumbnail_name(thumbnailer, {'size': (200, 200), 'crop': True}))
+
+    # Downscaling for a client using the highest density decodes the original and renders nothing
+    cache.clear()
+    result = FilerImageAdapter.placeholder(image, density=2, hints=ClientHints(dpr=2))
+    assert result['dimensions'] == [[200, 100], [400, 200]]
+    assert not storage.exists(FilerImageAdapter.thumbnail_name(thumbnailer, {'size': (200, 100)}))
+
+
+@mock.patch('retina.adapters.filer.get_thumbnailer')
+@mock.patch('retina.adapters.filer.aliases')
+def test_profile_report(aliases_mock, get_thumbnailer_mock):
+    filer_image = mock.Mock(name='FilerImage', subject_location=None)
+
+    def get_thumbnail(options, save=True):
+        return MagicMock(name='Thumbnail', size=options.get('quality', 85) * 100)
+
+    thumbnailer_mock = MagicMock(name='Thumbnailer')
+    thumbnailer_mock.get_thumbnail.side_effect = get_thumbnail
+    get_thumbnailer_mock.return_value = thumbnailer_mock
+    aliases_mock.get.return_value = {'size': (300, 300)}
+
+    result = FilerImageAdapter().profile_report(filer_image, alias='foo', density=3, profiles={2: {'quality': 60}})
+    assert result == [
+        {'density': 2, 'profile': {'quality': 60}, 'before': 8500, 'after': 6000},
+        {'density': 3, 'profile': {'quality': 60}, 'before': 8500, 'after': 6000},
+    ]
+
+    # Reporting must never save anything
+    thumbnailer_mock.get_thumbnail.assert_any_call({'size': (600, 600)}, save=False)
+    thumbnailer_mock.get_thumbnail.assert_any_call({'size': (600, 600), 'quality': 60}, save=False)
+    assert all(kwargs == {'save': False} for _, _, kwargs in thumbnailer_mock.get_thumbnail.mock_calls)
+
+
+@mock.patch('retina.adapters.filer.get_thumbnailer')
+@mock.patch('retina.adapters.filer.aliases')
+def test_variants(aliases_mock, get_thumbnailer_mock):
+    filer_image = mock.Mock(name='FilerImage', width=300, height=300, subject_location=None)
+
+    thumbnailer_mock = MagicMock(name='Thumbnailer')
+    thumbnailer_mock.get_options.side_effect = lambda options: options
+    thumbnailer_mock.get_thumbnail_name.side_effect = lambda options, transparent: '{}x{}{}.{}'.format(
+        *options['size'], '_q{}'.format(options['quality']) if 'quality' in options else '',
+        'png' if transparent else 'jpg')
+    get_thumbnailer_mock.return_value = thumbnailer_mock
+    aliases_mock.all.return_value = {'foo': {'size': (100, 100)}, 'nosize': {'crop': True}}
+    aliases_mock.get.side_effect = lambda alias: aliases_mock.all.return_value.get(alias)
+
+    result = FilerImageAdapter().variants(filer_image, density=2, profiles={2: {'quality': 50}})
+    assert result == {
+        '150x150.jpg': (None, 1),
+        '150x150.png': (None, 1),
+        '150x150.jpg.retina2.json': (None, 0),
+        '100x100.jpg': ('foo', 1),
+        '100x100.png': ('foo', 1),
+        '200x200_q50.jpg': ('foo', 2),
+        '200x200_q50.png': ('foo', 2),
+        '100x100.jpg.retina2.json': ('foo', 0),
+    }
+
+    # The curve of an alias replaces the passed in one
+    result = FilerImageAdapter().variants(filer_image, density=2, profiles={2: {'quality': 50}},
+                                          alias_profiles={'foo': {1: {'quality': 70}}})
+    assert result['100x100_q70.jpg'] == ('foo', 1)
+    assert result['200x200_q70.jpg'] == ('foo', 2)
+    assert result['150x150.jpg'] == (None, 1)
+
+    # Nothing must be rendered
+    thumbnailer_mock.get_thumbnail.assert_not_called()
+
+
+def test_content_hash_name():
+    assert content_hash_name('abcdef', 'foo/bar/image.JPG') == 'retina/ab/abcdef.jpg'
+
+
+def test_content_hash_thumbnailer(tmpdir):
+    storage = FileSystemStorage(location=str(tmpdir))
+    thumbnailer = ContentHashThumbnailer(
+        file=None, name='filer_public/1/image.jpg', shared_name='retina/ab/abcdef.jpg',
+        source_storage=storage, thumbnail_storage=storage, thumbnail_basedir='thumbs')
+
+    name = thumbnailer.get_thumbnail_name(thumbnailer.get_options({'size': (100, 100)}))
+    assert name.startswith('thumbs/retina/ab/abcdef.jpg__100x100')
+
+    # The source itself is still read from its real location
+    assert thumbnailer.name == 'filer_public/1/image.jpg'
+
+    # Only the existence of the thumbnail matters, not the modification time of the source
+    assert not thumbnailer.thumbnail_exists(name)
+    storage.save(name, ContentFile(b'foo'))
+    assert thumbnailer.thumbnail_exists(name)
+
+    # Remote sources are never cached, just like with the regular thumbnailer
+    thumbnailer = ContentHashThumbnailer(
+        file=None, name='http://example.com/image.jpg', shared_name='retina/ab/abcdef.jpg', remote_source=True,
+        source_storage=storage, thumbnail_storage=storage, thumbnail_basedir='thumbs')
+    assert not thumbnailer.thumbnail_exists(name)
+    assert thumbnailer.get_source_cache(create=True) is None
+
+
+def test_content_hash_adapter():
+    filer_image = mock.Mock(name='FilerImage', sha1='abcdef')
+    filer_image.file.name = 'filer_public/1/image.jpg'
+    filer_image.file.thumbnail_basedir = 'thumbs'
+
+    thumbnailer = ContentHashFilerImageAdapter.thumbnailer(filer_image)
+    assert isinstance(thumbnailer, ContentHashThumbnailer)
+    assert thumbnailer.shared_name == 'retina/ab/abcdef.jpg'
+    assert ContentHashFilerImageAdapter.source_name(filer_image) == 'retina/ab/abcdef.jpg'
+    assert FilerImageAdapter.source_name(filer_image) == 'filer_public/1/image.jpg'
+    assert ContentHashFilerFileAdapter._image_adapter() == ContentHashFilerImageAdapter
+    assert FilerFileAdapter._image_adapter() == FilerImageAdapter
+
+    # Private files fall back to the regular thumbnailer, filer only serves their thumbnails from below their path
+    filer_image.is_public = False
+    with mock.patch('retina.adapters.filer.get_thumbnailer') as get_thumbnailer_mock:
+        ContentHashFilerImageAdapter.thumbnailer(filer_image)
+        get_thumbnailer_mock.assert_called_with(filer_image)
+    assert ContentHashFilerImageAdapter.source_name(filer_image) == 'filer_public/1/image.jpg'
+
+    # Files without a hash fall back to the regular thumbnailer as well
+    filer_image.is_public = True
+    filer_image.sha1 = ''
+    with mock.patch('retina.adapters.filer.get_thumbnailer') as get_thumbnailer_mock:
+        ContentHashFilerImageAdapter.thumbnailer(filer_image)
+        get_thumbnailer_mock.assert_called_with(filer_image)
+    assert ContentHashFilerImageAdapter.source_name(filer_image) == 'filer_public/1/image.jpg'
+
+
+def test_load_default_adapters():
+    manager = Manager()
+    manager.load_default_adapters()
+    assert manager._adapters[FilerImage] == FilerImageAdapter
+    assert manager._adapters[FilerFile] == FilerFileAdapter
+
+    manager.load_default_adapters(content_hash=True)
+    assert manager._adapters[FilerImage] == ContentHashFilerImageAdapter
+    assert manager._adapters[FilerFile] == ContentHashFilerFileAdapter
+
+
+@mock.patch('retina.adapters.filer.FilerImageAdapter.lazy_url')
+@mock.patch('retina.adapters.filer.get_thumbnailer')
+@mock.patch('retina.adapters.filer.aliases')
+def test_retina_upscale_client_hints(aliases_mock, get_thumbnailer_mock, lazy_url_mock):
+    filer_image = mock.Mock(name='FilerImage', subject_location=None)
+
+    thumbnailer_mock = MagicMock(name='Thumbnailer')
+    thumbnailer_mock.get_thumbnail.side_effect = lambda options: MagicMock(
+        name='Thumbnail', url='{}x{}'.format(*options['size']))
+    thumbnailer_mock.get_existing_thumbnail.return_value = None
+    get_thumbnailer_mock.return_value = thumbnailer_mock
+    aliases_mock.get.return_value = {'size': (300, 300)}
+    lazy_url_mock.side_effect = lambda file, options: 'lazy-{}x{}'.format(*options['size'])
+
+    # Only the @2 version gets rendered, the others are rendered once they're requested
+    result = FilerImageAdapter().retina_upscale(filer_image, 'foo', density=3, hints=ClientHints(dpr=2))
+    assert result == ['lazy-300x300', '600x600', 'lazy-900x900']
+    thumbnailer_mock.get_thumbnail.assert_called_once_with({'size': (600, 600)})
+    thumbnailer_mock.get_existing_thumbnail.assert_has_calls([
+        call({'size': (300, 300)}),
+        call({'size': (900, 900)}),
+    ])
+
+    # Existing thumbnails are returned as they are
+    thumbnailer_mock.get_existing_thumbnail.return_value = MagicMock(name='Thumbnail', url='existing')
+    lazy_url_mock.reset_mock()
+    result = FilerImageAdapter().retina_upscale(filer_image, 'foo', density=2, hints=ClientHints(dpr=1))
+    assert result == ['300x300', 'existing']
+    lazy_url_mock.assert_not_called()
+
+
+@mock.patch('retina.adapters.filer.aliases')
+@override_settings(THUMBNAIL_HIGH_RESOLUTION=True, ROOT_URLCONF='tests.urls')
+def test_retina_upscale_client_hints_high_resolution(aliases_mock, tmpdir):
+    setup_database()
+    storage = FileSystemStorage(location=str(tmpdir))
+    image = SourceImage(storage, size=(400, 200))
+    aliases_mock.get.return_value = {'size': (100, 100), 'crop': True}
+
+    result = FilerImageAdapter.retina_upscale(image, 'foo', density=2, hints=ClientHints(dpr=1))
+    assert result[0].endswith('image.jpg__100x100_q85_crop_subsampling-2.jpg')
+    assert result[1].startswith('/retina/thumbnail/')
@@ -0,0 +1,57 @@
+import threading
+
+from retina.hints import ClientHints, get_current, set_current
+
+
+def test_from_meta():
+    assert ClientHints.from_meta({}) == ClientHints()
+    assert not ClientHints.from_meta({})
+
+    hints = ClientHints.from_meta({
+        'HTTP_SEC_CH_DPR': '2.5',
+        'HTTP_SEC_CH_WIDTH': '600',
+        'HTTP_SEC_CH_VIEWPORT_WIDTH': '400',
+    })
+    assert hints == ClientHints(dpr=2.5, width=600, viewport_width=400)
+    assert hints
+
+    # Legacy headers are used as a fallback, malformed values are ignored
+    hints = ClientHints.from_meta({'HTTP_SEC_CH_DPR': 'foo', 'HTTP_DPR': '2', 'HTTP_VIEWPORT_WIDTH': '-1'})
+    assert hints == ClientHints(dpr=2.0)
+
+
+def test_densities():
+    assert ClientHints().densities(3) == [1]
+    assert ClientHints(dpr=1).densities(3) == [1]
+    assert ClientHints(dpr=1.5).densities(3) == [2]
+    assert ClientHints(dpr=2.000001).densities(3) == [2]
+    assert ClientHints(dpr=2).densities(1) == [1]
+    assert ClientHints(dpr=4).densities(3) == [3]
+
+    # The width of the @1 version is needed to take the widths into account
+    assert ClientHints(dpr=2, viewport_width=100).densities(3) == [2]
+    assert ClientHints(dpr=2, viewport_width=100).densities(3, base_width=300) == [1]
+    assert ClientHints(dpr=3, viewport_width=200).densities(3, base_width=300) == [2]
+    assert ClientHints(dpr=3, viewport_width=400).densities(3, base_width=300) == [3]
+    assert ClientHints(dpr=3, width=300).densities(3, base_width=300) == [1]
+    assert ClientHints(dpr=1, width=600).densities(3, base_width=300) == [2]
+
+
+def test_current():
+    assert get_current() is None
+
+    hints = ClientHints(dpr=2)
+    set_current(hints)
+    try:
+        assert get_current() == hints
+
+        # Hints are kept per thread
+        other = []
+        thread = threading.Thread(target=lambda: other.append(get_current()))
+        thread.start()
+        thread.join()
+        assert other == [None]
+    finally:
+        set_current(None)
+
+    assert get_current() is None
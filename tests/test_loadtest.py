@@ -0,0 +1,101 @@
+import os
+
+import django
+import pytest
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.django_settings')
+django.setup()
+
+from unittest import mock
+
+from django.core.files.base import ContentFile
+
+from retina import Manager
+from retina.adapters.filer import FilerImageAdapter
+from retina.loadtest import LatencyStorage, run, _work
+from tests.conftest import DummyAdapterRetina
+from tests.helpers import setup_database, SourceImage
+
+
+def test_latency_storage(tmpdir):
+    storage = LatencyStorage(location=str(tmpdir), latency={'save': 0.01})
+    name = storage.save('foo.txt', ContentFile(b'foo'))
+
+    assert storage.exists(name)
+    assert storage.size(name) == 3
+
+    storage = LatencyStorage(location=str(tmpdir), error_rate={'exists': 1})
+    with pytest.raises(IOError):
+        storage.exists(name)
+
+    # Other operations are unaffected
+    assert storage.size(name) == 3
+
+
+def test_work_counts_storage_operations(tmpdir):
+    storage = LatencyStorage(location=str(tmpdir))
+
+    class StorageAdapter(DummyAdapterRetina):
+        @staticmethod
+        def retina(file, alias=None, density=0, profiles=None) -> list:
+            storage.exists(file)
+            return [file]
+
+    manager = Manager()
+    manager.update_adapters({str: StorageAdapter})
+
+    result = _work(['a.jpg', 'b.jpg'], None, None, manager)
+    assert len(result['latencies']) == 2
+    assert result['errors'] == 0
+    assert result['storage'] == {'exists': 2}
+
+    # Outside of a worker nothing gets counted
+    storage.exists('a.jpg')
+    assert result['storage'] == {'exists': 2}
+
+
+def test_run():
+    manager = Manager()
+    manager.update_adapters({str: DummyAdapterRetina})
+
+    result = run(['a.jpg', 'b.jpg'], alias='foo', workers=3, iterations=2, manager=manager)
+    assert result['requests'] == 12
+    assert result['errors'] == 0
+    assert result['renders'] == 0
+    assert result['duplicate_renders'] == 0
+    assert result['storage'] == {}
+    assert result['latency']['p50'] <= result['latency']['p99'] <= result['latency']['max']
+
+    # Sizes without alias raise a ValueError in srcset
+    result = run(['a.jpg'], sizes=['sm'], workers=2, manager=manager)
+    assert result['errors'] == 2
+
+
+@mock.patch('retina.adapters.filer.aliases')
+def test_run_renders(aliases_mock, tmpdir):
+    setup_database()
+    storage = LatencyStorage(location=str(tmpdir), latency={'save': 0.1})
+    image = SourceImage(storage, size=(400, 200))
+    aliases_mock.get.return_value = {'size': (100, 100), 'crop': True}
+
+    manager = Manager()
+    manager.update_adapters({SourceImage: FilerImageAdapter})
+    manager.update_density(2)
+
+    # Every worker asks for the same image at once, so the slow saves let some of them render it again
+    result = run([image], alias='foo', workers=4, manager=manager)
+    assert result['requests'] == 4
+    assert result['errors'] == 0
+    assert 2 < result['renders'] <= 8
+    assert result['duplicate_renders'] == result['renders'] - 2
+    assert result['storage']['save'] == result['storage']['open'] == result['renders']
+    assert result['storage']['url'] == 8
+
+    # Once the thumbnails exist, nothing gets rendered anymore
+    result = run([image], alias='foo', workers=4, iterations=2, manager=manager)
+    assert result['requests'] == 8
+    assert result['errors'] == 0
+    assert result['renders'] == 0
+    assert result['duplicate_renders'] == 0
+    assert 'save' not in result['storage']
+    assert result['storage']['url'] == 16
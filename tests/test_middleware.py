@@ -0,0 +1,52 @@
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.django_settings')
+django.setup()
+
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from retina import File, Manager
+from retina.hints import ClientHints, get_current
+from retina.middleware import ClientHintsMiddleware
+from tests.conftest import DummyAdapterClientHints
+
+
+def test_client_hints_middleware():
+    seen = []
+
+    def get_response(request):
+        seen.append(get_current())
+        return HttpResponse()
+
+    request = RequestFactory().get('/', HTTP_SEC_CH_DPR='2', HTTP_VIEWPORT_WIDTH='400')
+    response = ClientHintsMiddleware(get_response)(request)
+
+    assert seen == [ClientHints(dpr=2.0, viewport_width=400)]
+    assert get_current() is None
+
+    # Nothing made use of the hints, so the response stays cacheable for everyone
+    assert not response.has_header('Accept-CH')
+    assert not response.has_header('Vary')
+
+
+def test_client_hints_middleware_used():
+    manager = Manager()
+    manager.update_adapters({str: DummyAdapterClientHints})
+    manager.update_client_hints(True)
+
+    def get_response(request):
+        return HttpResponse(str(File('dummy.file', manager=manager).srcset(alias='foo')))
+
+    request = RequestFactory().get('/', HTTP_SEC_CH_DPR='2')
+    response = ClientHintsMiddleware(get_response)(request)
+
+    assert 'lazy.dummyfile_density_1.foo.file' in response.content.decode('utf-8')
+    assert 'Sec-CH-DPR' in response['Accept-CH']
+    assert 'Sec-CH-DPR' in response['Vary']
+
+    # The flag doesn't leak into the next request
+    response = ClientHintsMiddleware(lambda request: HttpResponse())(RequestFactory().get('/'))
+    assert not response.has_header('Vary')
@@ -0,0 +1,30 @@
+import base64
+import io
+
+from PIL import Image
+
+from retina.placeholders import lqip, dominant_color, LQIP_SIZE
+
+
+def test_lqip():
+    image = Image.new('RGB', (300, 200), (255, 0, 0))
+    result = lqip(image)
+
+    assert result.startswith('data:image/jpeg;base64,')
+
+    thumbnail = Image.open(io.BytesIO(base64.b64decode(result.split(',', 1)[1])))
+    assert thumbnail.size[0] <= LQIP_SIZE[0]
+    assert thumbnail.size[1] <= LQIP_SIZE[1]
+
+    # The original image must not be touched
+    assert image.size == (300, 200)
+
+
+def test_lqip_transparent():
+    image = Image.new('RGBA', (50, 50), (0, 0, 0, 0))
+    assert lqip(image).startswith('data:image/jpeg;base64,')
+
+
+def test_dominant_color():
+    assert dominant_color(Image.new('RGB', (10, 10), (255, 0, 0))) == '#ff0000'
+    assert dominant_color(Image.new('L', (10, 10), 255)) == '#ffffff'
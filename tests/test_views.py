@@ -0,0 +1,58 @@
+import os
+
+import django
+import pytest
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.django_settings')
+django.setup()
+
+from unittest import mock
+from unittest.mock import MagicMock
+
+from django.core import signing
+from django.http import Http404
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+from filer.models import File as FilerFile
+
+from retina import views
+from retina.adapters.filer import FilerImageAdapter
+
+
+@override_settings(ROOT_URLCONF='tests.urls')
+@mock.patch('retina.views.get_object_or_404')
+@mock.patch('retina.views.manager')
+def test_thumbnail(manager_mock, get_object_or_404_mock):
+    filer_image = mock.Mock(name='FilerImage', pk=42)
+    get_object_or_404_mock.return_value = filer_image
+
+    adapter_mock = MagicMock(name='Adapter')
+    adapter_mock.render.return_value = '/media/thumbs/image.jpg__600x600_q85_crop.jpg'
+    manager_mock.get_adapter.return_value = adapter_mock
+
+    url = FilerImageAdapter.lazy_url(filer_image, {'size': (600, 600), 'crop': True})
+    match = resolve(url)
+    assert match.view_name == 'retina:thumbnail'
+
+    response = match.func(RequestFactory().get(url), **match.kwargs)
+    assert response.status_code == 302
+    assert response['Location'] == '/media/thumbs/image.jpg__600x600_q85_crop.jpg'
+    get_object_or_404_mock.assert_called_once_with(FilerFile, pk=42)
+
+    # Json turned the size into a list, easy_thumbnails needs a tuple to build the same name again
+    adapter_mock.render.assert_called_once_with(filer_image, {'size': (600, 600), 'crop': True})
+    assert isinstance(adapter_mock.render.call_args[0][1]['size'], tuple)
+
+
+@mock.patch('retina.views.get_object_or_404')
+def test_thumbnail_bad_signature(get_object_or_404_mock):
+    token = signing.dumps({'pk': 42, 'options': {'size': (9000, 9000)}}, salt='retina.thumbnail', compress=True)
+
+    with pytest.raises(Http404):
+        views.thumbnail(RequestFactory().get('/'), token + 'x')
+
+    # Tokens signed for anything else aren't accepted either
+    with pytest.raises(Http404):
+        views.thumbnail(RequestFactory().get('/'), signing.dumps({'pk': 42, 'options': {'size': (9000, 9000)}}))
+
+    get_object_or_404_mock.assert_not_called()
@@ -0,0 +1,5 @@
+from django.conf.urls import url, include
+
+urlpatterns = [
+    url(r'^retina/', include('retina.urls')),
+]